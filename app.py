@@ -1,26 +1,43 @@
 import os
+import re
 import json
+import random
+import bisect
+import hashlib
+import heapq
+import hmac
+import itertools
+import sqlite3
 import time
+import queue
 import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 import asyncio
 import crcmod.predefined
 import gspread
-import numpy as np
-import pandas as pd
+from gspread.exceptions import APIError
+from gspread.utils import absolute_range_name
 import pytz
+import requests
 import telebot
 from oauth2client.service_account import ServiceAccountCredentials
+from requests.adapters import HTTPAdapter
 from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
 from telebot.types import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     ReplyKeyboardMarkup,
     KeyboardButton,
 )
+from urllib3.util.retry import Retry
 
-from flask import Flask
+from flask import Flask, request
 app = Flask(__name__)
 
 @app.route("/", methods=["GET", "HEAD"])
@@ -58,42 +75,88 @@ MONTHS_RU = {
     12: "Декабрь",
 }
 
-# ---------- Загрузка сервисного ключа Google с вариативностью ----------
+# ---------- Общий пул HTTP‑соединений ----------
+
+# Telegram, Google Sheets и anekdot.ru ходят через один HTTPAdapter:
+# keep-alive соединения переиспользуются, TLS не устанавливается заново
+# на каждый запрос, а число одновременных соединений с хостом ограничено.
+http_pool_hosts = 10  # хостов с отдельным пулом
+http_pool_size = int(os.getenv("HTTP_POOL_SIZE", 16))  # соединений на хост, не меньше
+http_retries = int(os.getenv("HTTP_RETRIES", 3))  # повторов при сбое соединения
+
+http_adapter = HTTPAdapter(
+    pool_connections=http_pool_hosts,
+    pool_maxsize=http_pool_size,
+    pool_block=True,  # при занятом пуле запрос ждет свободного соединения
+    # ответы 429/5xx Sheets повторяет SheetsClient с учетом квоты, поэтому
+    # urllib3 повторяет только сбои соединения и отдает любой ответ как есть
+    max_retries=Retry(
+        total=http_retries,
+        connect=http_retries,
+        read=0,  # запрос мог дойти — повторять небезопасно
+        status=0,
+        backoff_factor=0.5,
+        respect_retry_after_header=False,  # иначе 429/503 с Retry-After повторяются здесь
+        raise_on_status=False,
+    ),
+)
 
-sa_json = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
 
-if sa_json:
-    # JSON сервисного аккаунта в переменной окружения
-    creds_dict = json.loads(sa_json)
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    spreadsheet_id = creds_dict["spreadsheet_id"]
-    TOKEN = creds_dict["botTOKEN"]
-    print("Используем ключ из переменной окружения GOOGLE_SERVICE_ACCOUNT_JSON")
-else:
-    # Локальный JSON-файл
-    key_path = os.getenv("KEY_PATH")
-    if key_path:
-        key_file = key_path
-        print(f"Используем ключ из KEY_PATH: {key_path}")
-    else:
-        key_file = "KEY/tb-fabric-dev.json"
-        print(f"Используем ключ по умолчанию: {key_file}")
+def mount_http_adapter(session: requests.Session) -> requests.Session:
+    """Подключение общего пула соединений к сессии requests."""
+    session.mount("https://", http_adapter)
+    session.mount("http://", http_adapter)
+    return session
 
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(key_file, scope)
 
-    with open(key_file, "r", encoding="utf-8") as file:
-        data = json.load(file)
+http_session = mount_http_adapter(requests.Session())
+# все потоки TeleBot используют одну сессию вместо собственной на поток
+telebot.apihelper.session = http_session
+
+
+# ---------- Загрузка сервисных ключей Google с вариативностью ----------
+
+GOOGLE_SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+]
+# Каталог с ключами арендаторов: каждый *.json — отдельная таблица и бот
+KEY_DIR = os.getenv("KEY_DIR")
+
+
+def load_tenant_keys() -> dict:
+    """Ключи арендаторов: имя -> содержимое JSON (с spreadsheet_id и botTOKEN)."""
+    sa_json = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
+    if sa_json:
+        # JSON сервисного аккаунта в переменной окружения
+        print("Используем ключ из переменной окружения GOOGLE_SERVICE_ACCOUNT_JSON")
+        return {"default": json.loads(sa_json)}
+
+    if KEY_DIR:
+        key_files = sorted(
+            os.path.join(KEY_DIR, name) for name in os.listdir(KEY_DIR) if name.endswith(".json")
+        )
+        print(f"Используем ключи из KEY_DIR: {KEY_DIR} ({len(key_files)} шт.)")
+    else:
+        # Локальный JSON-файл
+        key_path = os.getenv("KEY_PATH")
+        if key_path:
+            key_files = [key_path]
+            print(f"Используем ключ из KEY_PATH: {key_path}")
+        else:
+            key_files = ["KEY/tb-fabric-dev.json"]
+            print(f"Используем ключ по умолчанию: {key_files[0]}")
+
+    keys = {}
+    for key_file in key_files:
+        try:
+            with open(key_file, "r", encoding="utf-8") as file:
+                keys[os.path.splitext(os.path.basename(key_file))[0]] = json.load(file)
+        except (OSError, ValueError) as e:
+            # испорченный ключ одного арендатора не мешает остальным
+            print(f"load_tenant_keys {key_file}: {e}, пропускаем")
+    return keys
 
-    spreadsheet_id = data["spreadsheet_id"]
-    TOKEN = data["botTOKEN"]
 
 welcome_message = (
     "Я твой личный помощник для ведения учета рабочего времени и отчетности.\n\n"
@@ -130,11 +193,10 @@ def get_anekdot() -> str:
         return not any(word in text_lower for word in FORBIDDEN_WORDS)
     
     try:
-        import requests
         from bs4 import BeautifulSoup  # type: ignore
 
         url = "https://www.anekdot.ru/random/anekdot/"
-        response = requests.get(url, timeout=10)
+        response = http_session.get(url, timeout=10)
         soup = BeautifulSoup(response.text, "html.parser")
         topicboxes = soup.find_all("div", {"class": ["content content-min", "topicbox"]})
 
@@ -196,98 +258,637 @@ logs_sheet_name = "LOGS"
 logs_range = "A2:H"
 
 update_period = 300  # сек
+answers_tail_period = 60  # сек, период дочитывания новых строк "Отчет"
+results_ttl = 60  # сек, "Результативность" после синхронизации журнала обновляется сразу
+answers_reconcile_period = 3600  # сек, период полной сверки "Отчет"
+refresh_ahead = 0.2  # доля TTL: фоновое обновление начинается до его истечения
+refresh_tick = 5  # сек, период проверки фонового обновления
+refresh_rate_budget = 20  # запросов к Sheets в минуту для фонового обновления
+
+# Все обращения к Google Sheets идут через ограниченный пул потоков, чтобы
+# медленный или зависший запрос не занимал потоки обработки апдейтов. Пул у
+# каждого арендатора свой: ожидание квоты и паузы после 429 одного арендатора
+# не задерживают запросы остальных
+sheets_workers = int(os.getenv("SHEETS_WORKERS", 4))  # потоков на арендатора
+sheets_timeout = 10  # сек, дольше обработчик не ждет обновления, если в кеше есть данные
+# HTTP-таймауты клиента gspread: зависший запрос не держит поток пула вечно
+sheets_connect_timeout = 10  # сек
+sheets_read_timeout = int(os.getenv("SHEETS_READ_TIMEOUT", 60))  # сек
+
+
+def sheets_call(fn, *args, **kwargs):
+    """Выполнение запроса к Google Sheets в пуле Sheets текущего арендатора."""
+    t = current_tenant()
+    return t.sheets_executor.submit(in_tenant, t, fn, *args, **kwargs).result()
+
+
+# Квоты Sheets API считаются на сервисный аккаунт, то есть на арендатора
+sheets_reads_per_minute = int(os.getenv("SHEETS_READS_PER_MINUTE", 60))
+sheets_writes_per_minute = int(os.getenv("SHEETS_WRITES_PER_MINUTE", 60))
+sheets_burst = 10  # запросов подряд без ожидания
+sheets_retries = 5  # повторов при 429 (и 5xx для чтения)
+sheets_backoff = 1  # сек, первая пауза; дальше удваивается
+sheets_backoff_max = 32  # сек
+
+
+class TokenBucket:
+    """Ведро токенов: не больше per_minute запросов в любую минуту."""
+
+    def __init__(self, per_minute: int, burst: int = sheets_burst):
+        self.capacity = min(burst, per_minute - 1)
+        # всплеск входит в минутный бюджет
+        self.rate = (per_minute - self.capacity) / 60
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Занимает токен без ожидания; возвращает, через сколько секунд им можно воспользоваться."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            return max(wait, self.paused_until - now)
+
+    def acquire(self):
+        """Занимает токен; при пустом ведре ждет своей очереди."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Ни один токен не выдается ближайшие seconds секунд (после 429)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class SheetsClient(gspread.Client):
+    """Клиент gspread с лимитом запросов, повторами и склейкой одинаковых чтений."""
+
+    def __init__(self, auth, session=None):
+        super().__init__(auth, session)
+        self.read_bucket = TokenBucket(sheets_reads_per_minute)
+        self.write_bucket = TokenBucket(sheets_writes_per_minute)
+        # одинаковые GET, уже отправленные другими потоками: ключ -> Future
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextmanager
+    def fresh_reads(self, enabled: bool = True):
+        """GET внутри блока не присоединяются к уже отправленным запросам:
+        их ответ мог быть прочитан до записи вызывающего."""
+        previous = getattr(self.local, "fresh", False)
+        self.local.fresh = enabled or previous
+        try:
+            yield
+        finally:
+            self.local.fresh = previous
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        kwargs = dict(params=params, data=data, json=json, files=files, headers=headers)
+        if method != "get" or getattr(self.local, "fresh", False):
+            return self._send(method, endpoint, kwargs)
+
+        key = (endpoint, repr(params), repr(headers))
+        with self.inflight_lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            return future.result()
 
+        try:
+            response = self._send(method, endpoint, kwargs)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.inflight_lock:
+                self.inflight.pop(key, None)
+
+    def _send(self, method, endpoint, kwargs):
+        """Запрос в пределах квоты; 429 (и 5xx для чтения) — повтор с паузой."""
+        bucket = self.read_bucket if method == "get" else self.write_bucket
+        for attempt in range(sheets_retries + 1):
+            bucket.acquire()
+            try:
+                return super().request(method, endpoint, **kwargs)
+            except APIError as e:
+                status = e.response.status_code
+                # запись после 5xx могла примениться — ее не повторяем
+                retryable = status == 429 or (status >= 500 and method == "get")
+                if not retryable or attempt == sheets_retries:
+                    raise
+                delay = min(sheets_backoff_max, sheets_backoff * 2**attempt)
+                print(f"Sheets {status}, повтор через {delay} с")
+            time.sleep(delay / 2 + random.uniform(0, delay / 2))
 
-gc = gspread.authorize(creds).open_by_key(spreadsheet_id)
-settings_sheet = gc.worksheet(settings_sheet_name)
-models_sheet = gc.worksheet(questions_sheet_name)
-questions_sheet = gc.worksheet(questions_sheet_name)
-questions_detail_sheet = gc.worksheet(questions_sheet_name)
-answers_sheet = gc.worksheet(answers_sheet_name)
-goals_sheet = gc.worksheet(goals_sheet_name)
-logs_sheet = gc.worksheet(logs_sheet_name)
-results_sheet = gc.worksheet(results_sheet_name)
-
-# Кеши и время обновления
-goals_last_update = datetime(2023, 1, 1, 23, 59, 59)
-questions_detail_last_update = datetime(2023, 1, 1, 23, 59, 59)
-questions_last_update = datetime(2023, 1, 1, 23, 59, 59)
-models_last_update = datetime(2023, 1, 1, 23, 59, 59)
-settings_last_update = datetime(2023, 1, 1, 23, 59, 59)
-answers_last_update = datetime(2023, 1, 1, 23, 59, 59)
-results_last_update = datetime(2023, 1, 1, 23, 59, 59)
-operations_detail_last_update = datetime(2023, 1, 1, 23, 59, 59)
-
-settings = []
-models = []
-questions = []
-questions_detail = []
-operations_detail = []
-answers = []
-results = []
-goals = []
 
+# ==============================
+#  Арендаторы
+# ==============================
 
-def reload_data(message=None, scope="m+q+qd+g+s", force=False, silent=False):
-    """Универсальная функция подгрузки данных из таблиц."""
-    global models_sheet, models
-    global questions_sheet, questions
-    global questions_detail_sheet, questions_detail
-    global operations_detail
-    global goals_sheet, goals
-    global settings_sheet, settings
-    global goals_last_update, questions_detail_last_update
-    global questions_last_update, models_last_update, settings_last_update
-    global answers_last_update, results_last_update, operations_detail_last_update
-    global answers, results, results_sheet
+# Один процесс обслуживает несколько таблиц и ботов. Состояние каждого —
+# в своем Tenant, а функции работают с арендатором текущего потока через
+# tenant: его выставляют поток чата, пул Sheets, webhook и фоновые циклы.
+_tenant_local = threading.local()
 
-    if message and not silent:
-        info_msg = bot.send_message(message.chat.id, "Загружаю данные...")
+
+def current_tenant():
+    """Арендатор, от имени которого работает текущий поток."""
+    t = getattr(_tenant_local, "tenant", None)
+    if t is None:
+        raise RuntimeError("Нет текущего арендатора")
+    return t
+
+
+class CurrentTenant:
+    """tenant.settings, tenant.bot и т.д. — состояние арендатора текущего потока."""
+
+    def __getattr__(self, name):
+        return getattr(current_tenant(), name)
+
+    def __setattr__(self, name, value):
+        setattr(current_tenant(), name, value)
+
+
+tenant = CurrentTenant()
+
+
+@contextmanager
+def use_tenant(t):
+    """Выполнение блока от имени арендатора t."""
+    previous = getattr(_tenant_local, "tenant", None)
+    _tenant_local.tenant = t
+    try:
+        yield t
+    finally:
+        _tenant_local.tenant = previous
+
+
+def in_tenant(t, fn, *args, **kwargs):
+    """Вызов fn от имени арендатора t (для пулов потоков)."""
+    with use_tenant(t):
+        return fn(*args, **kwargs)
+
+
+NEVER_UPDATED = datetime(2023, 1, 1, 23, 59, 59)
+
+
+class Tenant:
+    """Таблица и бот одного клиента: ключ, листы, кеши, индексы и журнал."""
+
+    def __init__(self, name: str, key: dict, data_dir: str):
+        self.name = name
+        self.creds = ServiceAccountCredentials.from_json_keyfile_dict(key, GOOGLE_SCOPE)
+        self.spreadsheet_id = key["spreadsheet_id"]
+        self.token = key["botTOKEN"]
+
+        client = gspread.authorize(self.creds, client_factory=SheetsClient)
+        client.set_timeout((sheets_connect_timeout, sheets_read_timeout))
+        mount_http_adapter(client.session)
+        self.client = client
+        self.sheets_executor = ThreadPoolExecutor(
+            max_workers=sheets_workers, thread_name_prefix=f"sheets-{name}"
+        )
+        self.gc = client.open_by_key(self.spreadsheet_id)
+        self.settings_sheet = self.gc.worksheet(settings_sheet_name)
+        self.models_sheet = self.gc.worksheet(questions_sheet_name)
+        self.questions_sheet = self.gc.worksheet(questions_sheet_name)
+        self.questions_detail_sheet = self.gc.worksheet(questions_sheet_name)
+        self.answers_sheet = self.gc.worksheet(answers_sheet_name)
+        self.goals_sheet = self.gc.worksheet(goals_sheet_name)
+        self.logs_sheet = self.gc.worksheet(logs_sheet_name)
+        self.results_sheet = self.gc.worksheet(results_sheet_name)
+
+        # Кеши и время обновления
+        self.goals_last_update = NEVER_UPDATED
+        self.questions_detail_last_update = NEVER_UPDATED
+        self.questions_last_update = NEVER_UPDATED
+        self.models_last_update = NEVER_UPDATED
+        self.settings_last_update = NEVER_UPDATED
+        self.answers_last_update = NEVER_UPDATED
+        self.results_last_update = NEVER_UPDATED
+        self.operations_detail_last_update = NEVER_UPDATED
+        self.answers_reconciled_at = NEVER_UPDATED
+        self.answers_next_row = 2  # первая еще не прочитанная строка листа "Отчет"
+
+        self.settings = []
+        self.admin_ids = frozenset()  # user_id администраторов из settings
+        self.models = []
+        self.questions = []
+        self.questions_detail = []
+        self.operations_detail = []
+        self.answers = []
+        self.results = []
+        self.results_by_day = {}  # (user_id, дата) -> сумма за день
+        self.results_by_user = {}  # user_id -> строки пользователя, включая "Всего (...)"
+        # user_id -> время, когда его операции последний раз ушли в лист
+        self.results_synced_at = {}
+        # Готовые тексты отчетов, пересобираются при обновлении "Результативность"
+        self.month_reports = {}  # user_id -> сообщения "Результат за месяц"
+        self.company_report = []  # сообщения отчета по всем сотрудникам
+        self.goals = []
+
+        # Публикация новых значений кешей и индексов под одной блокировкой
+        self.cache_lock = threading.Lock()
+        self.refresh_calls = deque()  # время запросов cache_refresher за минуту
+        # Загрузки, идущие сейчас: scope -> (Future, время начала, force) (single-flight)
+        self.flights = {}
+        self.flights_lock = threading.Lock()
+        # Маркерные строки "@last_update" каталога: scope -> (диапазон строки, значения)
+        self.catalog_markers = {}
+
+        # Индекс каталога, пересобирается в reload_data после обновления m/q/qd
+        self.catalog_index = {
+            "models": {},  # crc модели -> название
+            "operations": {},  # crc операции -> текст
+            "groups": {},  # (crc модели, crc группы, уровень) -> JSON клавиатуры подгрупп
+            "details": {},  # (crc модели, crc группы) -> JSON клавиатуры операций
+        }
+        self.catalog_fingerprint = None
+        # Готовые JSON клавиатур: (вариант, версия каталога) -> JSON
+        self.markup_cache = {}
+
+        # Журнал отчетов
+        self.data_dir = data_dir
+        # имя журнала — по таблице: процессы с общим DATA_DIR не смешивают
+        # отчеты разных таблиц и не отправляют их в чужой лист
+        self.journal_path = os.path.join(data_dir, f"journal-{self.spreadsheet_id}.sqlite3")
+        self.journal_lock = threading.Lock()
+        self.journal_db = None
+        self.append_uncertain = False  # последний append_rows мог примениться несмотря на ошибку
+        # Неудаленные операции по пользователям, по возрастанию времени:
+        # user_id -> [(ts, id, (user_id, model, operation, quantity, date, add_time))]
+        self.user_operations = {}
+
+        self.latest_messages = LatestMessages()
+        # По умолчанию выводится из токена
+        self.webhook_secret = (
+            os.getenv("WEBHOOK_SECRET") or hashlib.sha256(self.token.encode("utf-8")).hexdigest()
+        )
+        self.bot = MyBot(self.token, self)
+        for kind, callback, kwargs in HANDLERS:
+            if kind == "message":
+                self.bot.register_message_handler(callback, **kwargs)
+            else:
+                self.bot.register_callback_query_handler(callback, **kwargs)
+
+
+# scope -> (лист, диапазон) для reload_data
+SCOPE_RANGES = {
+    "s": (settings_sheet_name, settings_range),
+    "m": (questions_sheet_name, models_range),
+    "q": (questions_sheet_name, questions_range),
+    "qd": (questions_sheet_name, questions_detail_range),
+    "od": (questions_sheet_name, operations_detail_range),
+    "g": (goals_sheet_name, goals_range),
+    "a": (answers_sheet_name, answer_range),
+    "r": (results_sheet_name, results_range),
+}
+# TTL областей; все, кроме ON_DEMAND_SCOPES, держит теплыми фоновый cache_refresher
+SCOPE_TTL = {
+    "s": update_period,
+    "m": update_period,
+    "q": update_period,
+    "qd": update_period,
+    "g": update_period,
+    "r": results_ttl,
+    "a": answers_tail_period,
+}
+# Области, которые читаются редко: они обновляются при чтении по TTL, а фоном —
+# только после синхронизации журнала (results_outdated)
+ON_DEMAND_SCOPES = ("r",)
+
+refresher_running = False  # cache_refresher обслуживает всех арендаторов
+
+
+def scope_last_update(s: str) -> datetime:
+    """Время последнего обновления кеша области."""
+    return {
+        "s": tenant.settings_last_update,
+        "m": tenant.models_last_update,
+        "q": tenant.questions_last_update,
+        "qd": tenant.questions_detail_last_update,
+        "od": tenant.operations_detail_last_update,
+        "g": tenant.goals_last_update,
+        "a": tenant.answers_last_update,
+        "r": tenant.results_last_update,
+    }[s]
+
+
+# Области каталога и столбцы их маркерных строк "@last_update"
+CATALOG_SCOPES = ("m", "q", "qd")
+CATALOG_MARKER_COLUMNS = {"q": ("J", "K"), "qd": ("U", "AB")}
+
+
+def remember_catalog_marker(s: str, values: list):
+    """Запоминает положение и содержимое строки-маркера "@last_update"."""
+    tenant.catalog_markers.pop(s, None)
+    for i, row in enumerate(values):
+        if row and row[0] == "@last_update":
+            # маркер без значения версии не позволяет обнаружить изменения
+            if any(row[1:]):
+                first, last = CATALOG_MARKER_COLUMNS[s]
+                row_number = i + 2
+                tenant.catalog_markers[s] = (
+                    absolute_range_name(questions_sheet_name, f"{first}{row_number}:{last}{row_number}"),
+                    tuple(row),
+                )
+            return
+
+
+def answers_read_start(current_time: datetime, force: bool = False) -> int:
+    """С какой строки читать "Отчет": 2 — полная сверка, иначе хвост.
+
+    Хвост читается с последней известной строки: она существует в сетке
+    листа и позволяет заметить сдвиг строк (вставку в начало листа).
+    """
+    if (
+        force
+        or tenant.answers_next_row <= 2
+        or (current_time - tenant.answers_reconciled_at).total_seconds() > answers_reconcile_period
+    ):
+        return 2
+    return tenant.answers_next_row - 1
+
+
+def merge_answers(values: list, start_row: int, current_time: datetime):
+    """Слияние прочитанных строк "Отчет" с таблицей в памяти и журналом."""
+
+    first_row = tenant.answers_next_row
+    if start_row == 2:
+        tenant.answers = values
+        new_rows = values
+        first_row = 2
+        tenant.answers_reconciled_at = current_time
+    elif values[:1] != tenant.answers[-1:]:
+        # строки сдвинулись — следующее чтение будет полной сверкой
+        new_rows = []
+        tenant.answers_reconciled_at = NEVER_UPDATED
     else:
-        info_msg = None
+        new_rows = values[1:]
+        tenant.answers = tenant.answers + new_rows
+
+    tenant.answers_next_row = 2 + len(tenant.answers)
+    tenant.answers_last_update = current_time
+    journal_merge_sheet_rows(new_rows, first_row)
+
 
+def store_scope(s: str, values: list | None, current_time: datetime, answers_start: int = 2):
+    """Раскладывает значения диапазона по кешу области (None — только продлить TTL)."""
+
+    if s == "s":
+        if values is not None:
+            tenant.settings = values
+            tenant.admin_ids = frozenset(
+                row[1] for row in values if len(row) >= 2 and row[0] == "Администратор"
+            )
+        tenant.settings_last_update = current_time
+    if s == "m":
+        if values is not None:
+            tenant.models = values
+        tenant.models_last_update = current_time
+    if s == "q":
+        if values is not None:
+            remember_catalog_marker(s, values)
+            for row in values:
+                if len(row) < 2:
+                    continue
+                groups = row[1].split(";")
+                row[1:] = groups
+            tenant.questions = values
+        tenant.questions_last_update = current_time
+    if s == "qd":
+        if values is not None:
+            remember_catalog_marker(s, values)
+            tenant.questions_detail = values
+        tenant.questions_detail_last_update = current_time
+    if s == "od":
+        if values is not None:
+            tenant.operations_detail = values
+        tenant.operations_detail_last_update = current_time
+    if s == "g":
+        if values is not None:
+            tenant.goals = values
+        tenant.goals_last_update = current_time
+    if s == "a":
+        if values is not None:
+            merge_answers(values, answers_start, current_time)
+        tenant.answers_last_update = current_time
+    if s == "r":
+        if values is not None:
+            tenant.results = values
+            tenant.results_by_day, tenant.results_by_user = index_results(values)
+            materialize_reports(values)
+        tenant.results_last_update = current_time
+
+
+def index_results(values: list) -> tuple:
+    """Индексы "Результативность": (user_id, дата) -> сумма и user_id -> строки."""
+    by_day = {}
+    by_user = {}
+    for row in values:
+        if len(row) < 4:
+            continue
+        user_id = row[1]
+        total = re.fullmatch(r"Всего \((.*)\)", user_id)
+        if total:
+            user_id = total.group(1)
+        elif row[2]:
+            by_day.setdefault((user_id, row[2]), row[3])
+        by_user.setdefault(user_id, []).append(row)
+    return by_day, by_user
+
+
+def results_outdated(user_id=None) -> bool:
+    """Ушли ли операции пользователя (без user_id — любого) в лист
+    после загрузки "Результативность"."""
+    if user_id is None:
+        synced_at = max(tenant.results_synced_at.values(), default=NEVER_UPDATED)
+    else:
+        synced_at = tenant.results_synced_at.get(str(user_id), NEVER_UPDATED)
+    return synced_at > tenant.results_last_update
+
+
+def fetch_ranges(ranges: list) -> list:
+    """Загрузка нескольких диапазонов одним запросом values_batch_get."""
+    response = tenant.gc.values_batch_get(ranges)
+    value_ranges = response.get("valueRanges", [])
+    return [vr.get("values", []) for vr in value_ranges]
+
+
+def scope_range(s: str, answers_start: int = 2) -> str:
+    """Диапазон области для запроса; для "a" — начиная со строки answers_start."""
+    sheet_name, range_name = SCOPE_RANGES[s]
+    if s == "a" and answers_start > 2:
+        range_name = f"A{answers_start}:H"
+    return absolute_range_name(sheet_name, range_name)
+
+
+def fetch_scopes(scopes: list, answers_start: int = 2) -> list:
+    """Загрузка диапазонов нескольких областей одним запросом."""
+    return fetch_ranges([scope_range(s, answers_start) for s in scopes])
+
+
+def scope_is_stale(s: str, current_time: datetime, ahead: float = 0) -> bool:
+    """Истек ли (или истечет в ближайшие ahead секунд) TTL области."""
+    age = (current_time - scope_last_update(s)).total_seconds()
+    return age > SCOPE_TTL.get(s, update_period) - ahead
+
+
+def refresh_scopes(scopes: list, current_time: datetime, force: bool = False):
+    """Загрузка областей и атомарная публикация кешей и индекса каталога.
+
+    Если маркеры "@last_update" каталога не изменились, области m/q/qd не
+    скачиваются и индекс не пересобирается — продлевается только их TTL.
+    """
+    catalog = [s for s in scopes if s in CATALOG_SCOPES]
+    markers = [tenant.catalog_markers.get(s) for s in ("q", "qd")]
+    answers_start = answers_read_start(current_time, force)
+    fetched = {}
+    unchanged = []
+
+    # принудительная загрузка читает лист заново, не присоединяясь к GET,
+    # отправленному до записи вызывающего
+    with tenant.client.fresh_reads(force):
+        if catalog and not force and all(markers):
+            others = [s for s in scopes if s not in CATALOG_SCOPES]
+            values_list = fetch_ranges(
+                [scope_range(s, answers_start) for s in others] + [m[0] for m in markers]
+            )
+            fetched.update(zip(others, values_list))
+            probes = values_list[len(others) :]
+            if all(tuple(p[0]) == m[1] if p else False for p, m in zip(probes, markers)):
+                unchanged = catalog
+            else:
+                # маркеры q и qd обновляются только вместе с их данными, поэтому
+                # при расхождении скачивается весь каталог, а не только запрошенное
+                fetched.update(zip(CATALOG_SCOPES, fetch_scopes(list(CATALOG_SCOPES))))
+        else:
+            fetched.update(zip(scopes, fetch_scopes(scopes, answers_start)))
+
+    with tenant.cache_lock:
+        # загрузка, начатая позже этой, уже опубликовала более свежие данные
+        fetched = {s: v for s, v in fetched.items() if scope_last_update(s) <= current_time}
+        unchanged = [s for s in unchanged if scope_last_update(s) <= current_time]
+        for s, values in fetched.items():
+            store_scope(s, values, current_time, answers_start)
+        for s in unchanged:
+            store_scope(s, None, current_time)
+        if set(CATALOG_SCOPES) & set(fetched):
+            build_catalog_index()
+
+
+def start_refresh(scopes: list, current_time: datetime, force: bool = False) -> set:
+    """Запуск загрузки областей с single-flight по каждой области.
+
+    Области, которые уже загружаются, повторно не запрашиваются — вызывающий
+    ждет ту же загрузку. С force — только принудительную загрузку, начатую
+    не раньше current_time: более ранняя могла прочитать лист до записи
+    вызывающего. Возвращает futures, покрывающие все scopes.
+    """
+    t = current_tenant()
+    with t.flights_lock:
+        futures = set()
+        missing = []
+        for s in scopes:
+            flight = t.flights.get(s)  # (future, время начала, force)
+            if flight and (not force or (flight[2] and flight[1] >= current_time)):
+                futures.add(flight[0])
+            else:
+                missing.append(s)
+        if missing:
+            future = t.sheets_executor.submit(in_tenant, t, refresh_scopes, missing, current_time, force)
+            for s in missing:
+                t.flights[s] = (future, current_time, force)
+            futures.add(future)
+    if missing:
+        future.add_done_callback(lambda f: _finish_flight(t, missing, f))
+    return futures
+
+
+def _finish_flight(t, scopes: list, future):
+    with t.flights_lock:
+        for s in scopes:
+            if s in t.flights and t.flights[s][0] is future:
+                del t.flights[s]
+
+
+def reload_data(message=None, scope="m+q+qd+g+s", force=False, silent=False):
+    """Универсальная функция подгрузки данных из таблиц.
+
+    Пока работает cache_refresher, уже загруженные области, которые он держит
+    теплыми, отдаются из кеша без обращения к Google API.
+    """
     current_time = datetime.today()
 
+    stale = []
     for s in scope.split("+"):
-        if s == "s":
-            if (current_time - settings_last_update).total_seconds() > update_period or force:
-                settings = settings_sheet.get(settings_range)
-                settings_last_update = current_time
-        if s == "m":
-            if (current_time - models_last_update).total_seconds() > update_period or force:
-                models = models_sheet.get(models_range)
-                models_last_update = current_time
-        if s == "q":
-            if (current_time - questions_last_update).total_seconds() > update_period or force:
-                raw_questions = questions_sheet.get(questions_range)
-                for row in raw_questions:
-                    if len(row) < 2:
-                        continue
-                    groups = row[1].split(";")
-                    row[1:] = groups
-                questions[:] = raw_questions
-                questions_last_update = current_time
-        if s == "qd":
-            if (current_time - questions_detail_last_update).total_seconds() > update_period or force:
-                questions_detail = questions_detail_sheet.get(questions_detail_range)
-                questions_detail_last_update = current_time
-        if s == "od":
-            operations_detail = questions_sheet.get(operations_detail_range)
-            operations_detail_last_update = current_time
-        if s == "g":
-            if (current_time - goals_last_update).total_seconds() > update_period or force:
-                goals = goals_sheet.get(goals_range)
-                goals_last_update = current_time
-        if s == "a":
-            answers = answers_sheet.get(answer_range)
-            answers_last_update = current_time
-        if s == "r":
-            if (current_time - results_last_update).total_seconds() > update_period or force:
-                results = results_sheet.get(results_range)
-                results_last_update = current_time
-
-    if info_msg and not silent:
-        bot.delete_message(info_msg.chat.id, info_msg.message_id)
+        if s not in SCOPE_RANGES or s in stale:
+            continue
+        if force:
+            stale.append(s)
+        elif refresher_running and s not in ON_DEMAND_SCOPES and scope_last_update(s) != NEVER_UPDATED:
+            continue
+        elif scope_is_stale(s, current_time):
+            stale.append(s)
+
+    if not stale:
+        return
+
+    if message and not silent:
+        # вместо сообщения-заглушки — статус "печатает..." на время загрузки
+        tenant.bot.send_chat_action(message.chat.id, "typing")
+
+    # при наличии старых данных ждем не дольше sheets_timeout, обновление
+    # в этом случае закончится и опубликуется в фоне
+    futures = start_refresh(stale, current_time, force)
+    warm = not force and all(scope_last_update(s) != NEVER_UPDATED for s in stale)
+    done, not_done = wait_futures(futures, timeout=sheets_timeout if warm else None)
+    if not_done:
+        print(f"reload_data: {scope} обновляется дольше {sheets_timeout} с, отдаем кеш")
+    for future in done:
+        future.result()
+
+
+def cache_refresher():
+    """Фоновое обновление кешей с TTL до их истечения для всех арендаторов,
+    в пределах refresh_rate_budget на каждого."""
+    global refresher_running
+    refresher_running = True
+    while True:
+        now = time.monotonic()
+        current_time = datetime.today()
+        futures = []
+        for t in tenants.values():
+            calls = t.refresh_calls
+            while calls and now - calls[0] > 60:
+                calls.popleft()
+            with use_tenant(t):
+                due = [
+                    s
+                    for s, ttl in SCOPE_TTL.items()
+                    if s not in ON_DEMAND_SCOPES and scope_is_stale(s, current_time, ttl * refresh_ahead)
+                ]
+                if results_outdated():
+                    due.append("r")
+                if due and len(calls) < refresh_rate_budget:
+                    calls.append(now)
+                    futures.extend((t, f) for f in start_refresh(due, current_time))
+        for t, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"cache_refresher {t.name}: {e}")
+        time.sleep(refresh_tick)
 
 
 def get_setting(message=None, name=None):
@@ -295,17 +896,9 @@ def get_setting(message=None, name=None):
     if not name:
         return []
     names = name.split("+")
-    if message:
-        info = bot.send_message(message.chat.id, "Загружаю настройки...")
-    else:
-        info = None
+    reload_data(message, scope="s")
 
-    reload_data(scope="s")
-
-    if info:
-        bot.delete_message(info.chat.id, info.message_id)
-
-    return list(filter(lambda x: x and x[0] in names, settings))
+    return list(filter(lambda x: x and x[0] in names, tenant.settings))
 
 
 # ==============================
@@ -317,71 +910,500 @@ QUANTITY_PREFIX = "quantity_"
 MODEL_PREFIX = "model_"
 
 
+_crc32 = crcmod.predefined.mkCrcFun("crc-32")
+
+
+@lru_cache(maxsize=65536)
 def checksum(s: str) -> str:
     """CRC32 для строковых идентификаторов."""
-    crc32_func = crcmod.predefined.mkCrcFun("crc-32")
-    return str(crc32_func(s.encode("utf-8")))
+    return str(_crc32(s.encode("utf-8")))
+
+
+def _new_catalog_node(level: int) -> dict:
+    # children: путь подгруппы -> узел
+    return {"level": level, "children": {}}
+
+
+def build_catalog_index():
+    """Пересборка дерева каталога и клавиатур, если исходные диапазоны изменились."""
+
+    fingerprint = hashlib.md5(
+        json.dumps([tenant.models, tenant.questions, tenant.questions_detail], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    if fingerprint == tenant.catalog_fingerprint:
+        return
+
+    models_idx = {}
+    for m in tenant.models:
+        if m and m[0] != "@last_update":
+            models_idx[checksum(m[0])] = m[0]
+
+    # Дерево: модель -> уровни групп; ключ узла совпадает с путем в callback_data
+    nodes = {}
+    for q in tenant.questions:
+        if not q or len(q) < 2:
+            continue
+        model_crc = checksum(q[0])
+        node = nodes.get((model_crc, model_crc, 1))
+        if node is None:
+            node = nodes[(model_crc, model_crc, 1)] = _new_catalog_node(1)
+        for level in range(1, len(q)):
+            path = ";".join(q[1 : 1 + level])
+            child = node["children"].get(path)
+            if child is None:
+                child = node["children"][path] = _new_catalog_node(level + 1)
+                nodes[(model_crc, checksum(path), level + 1)] = child
+            node = child
+
+    operations_idx = {}
+    operations_by_group = {}
+    for qd in tenant.questions_detail:
+        if not qd or len(qd) <= 2:
+            continue
+        if qd[0] != "@last_update":
+            operations_idx.setdefault(checksum(qd[2]), qd[2])
+        operations_by_group.setdefault((checksum(qd[0]), checksum(qd[1])), []).append(qd[2])
+
+    tenant.catalog_index = {
+        "models": models_idx,
+        "operations": operations_idx,
+        "groups": {
+            key: build_groups_keyboard(key[0], node).to_json()
+            for key, node in nodes.items()
+            if node["children"]
+        },
+        "details": {
+            (model_crc, group_crc): build_operations_keyboard(model_crc, ops).to_json()
+            for (model_crc, group_crc), ops in operations_by_group.items()
+        },
+    }
+    tenant.catalog_fingerprint = fingerprint
+    tenant.markup_cache.clear()
 
 
 def model_by_id(model_id: str):
     """Поиск названия модели по её CRC."""
-    for m in set(map(tuple, models)):
-        if m and m[0] != "@last_update" and checksum(m[0]) == model_id:
-            return m[0]
-    return None
+    return tenant.catalog_index["models"].get(model_id)
 
 
 def question_detail_by_id(question_id: str):
     """Поиск текста операции по её CRC."""
-    for qd in set(map(tuple, questions_detail)):
-        if qd and qd[0] != "@last_update" and len(qd) > 2 and checksum(qd[2]) == question_id:
-            return qd[2]
-    return None
+    return tenant.catalog_index["operations"].get(question_id)
+
+
+class LatestMessages:
+    """Последнее сообщение с клавиатурой в каждом чате: chat_id -> message_id.
 
+    Callback с клавиатуры более старого сообщения не обрабатывается. Записи
+    старше ttl секунд забываются, так что память не растет с числом чатов.
+    Сообщение, у которого клавиатуру убрали на месте, остается последним, но
+    без клавиатуры: запоздалые нажатия на него просто игнорируются.
+    """
 
-class MessageUserSet(set):
-    """Множество (chat_id, message_id), чтобы не обрабатывать callback дважды."""
+    def __init__(self, ttl: float = 24 * 3600):
+        self.ttl = ttl
+        # chat_id -> (message_id, время записи, есть ли клавиатура);
+        # порядок ключей — от старых к новым
+        self.latest = {}
+        self.lock = threading.Lock()
 
-    def add(self, value):
-        new_message_id = value["message_id"]
-        new_user_id = value["chat_id"]
-        for record in self:
-            rec = dict(record)
-            if rec["chat_id"] == new_user_id:
-                super().discard(record)
-                break
-        super().add(frozenset({"message_id": new_message_id, "chat_id": new_user_id}.items()))
+    def add(self, chat_id: int, message_id: int, keyboard: bool = True):
+        now = time.monotonic()
+        with self.lock:
+            self.latest.pop(chat_id, None)
+            self.latest[chat_id] = (message_id, now, keyboard)
+            # истекшие записи — в начале словаря
+            while self.latest:
+                oldest = next(iter(self.latest))
+                if now - self.latest[oldest][1] <= self.ttl:
+                    break
+                del self.latest[oldest]
 
+    def add_sent(self, sent: Future):
+        """Запоминает сообщение, когда его отправка (Future из MyBot) завершится."""
+
+        def done(future):
+            if future.exception() is None:
+                message = future.result()
+                self.add(message.chat.id, message.message_id)
+
+        sent.add_done_callback(done)
+
+    def close(self, chat_id: int, message_id: int):
+        """Клавиатура сообщения убрана на месте: нажатия на нее больше не обрабатываются."""
+        self.add(chat_id, message_id, keyboard=False)
+
+    def _entry(self, chat_id: int, message_id: int):
+        entry = self.latest.get(chat_id)
+        if entry is None or entry[0] != message_id or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry
+
+    def is_latest(self, chat_id: int, message_id: int) -> bool:
+        """Последнее сообщение чата с активной клавиатурой."""
+        entry = self._entry(chat_id, message_id)
+        return entry is not None and entry[2]
+
+    def is_closed(self, chat_id: int, message_id: int) -> bool:
+        """Последнее сообщение чата, клавиатуру которого уже убрали."""
+        entry = self._entry(chat_id, message_id)
+        return entry is not None and not entry[2]
 
-message_user_set = MessageUserSet()
 
 
 # ==============================
 #  Бот и состояние пользователя
 # ==============================
 
+bot_threads = int(os.getenv("BOT_THREADS", 8))  # потоков обработки апдейтов
+chat_queue_size = int(os.getenv("CHAT_QUEUE_SIZE", 100))  # апдейтов в очереди потока
+
+
+def update_chat_id(update) -> int:
+    """chat_id апдейта (сообщения или callback) для выбора потока обработки."""
+    message = getattr(update, "message", None) if not hasattr(update, "chat") else update
+    if message is not None and getattr(message, "chat", None) is not None:
+        return message.chat.id
+    from_user = getattr(update, "from_user", None)
+    return from_user.id if from_user is not None else 0
+
+
+class ChatWorkerPool:
+    """Пул потоков: апдейты одного чата всегда идут в один поток и по порядку."""
+
+    def __init__(self, size: int, queue_size: int):
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(size)]
+        self.processed = [0] * size
+        self.failed = [0] * size
+        for i in range(size):
+            threading.Thread(
+                target=self._work, args=(i,), name=f"ChatWorker-{i}", daemon=True
+            ).start()
+
+    def put(self, chat_id: int, task, *args, **kwargs):
+        # при переполнении очереди поток опроса ждет — это и есть backpressure
+        self.queues[chat_id % len(self.queues)].put((task, args, kwargs))
+
+    def _work(self, i: int):
+        tasks = self.queues[i]
+        while True:
+            task, args, kwargs = tasks.get()
+            try:
+                task(*args, **kwargs)
+            except Exception as e:
+                self.failed[i] += 1
+                print(f"ChatWorker-{i}: {e!r}")
+            finally:
+                self.processed[i] += 1
+                tasks.task_done()
+
+    def metrics(self) -> str:
+        """Метрики пула в текстовом формате Prometheus."""
+        lines = [
+            f"tbot_chat_workers {len(self.queues)}",
+            f"tbot_chat_queue_capacity {self.queues[0].maxsize}",
+        ]
+        for i, tasks in enumerate(self.queues):
+            lines.append(f'tbot_chat_queue_depth{{worker="{i}"}} {tasks.qsize()}')
+            lines.append(f'tbot_chat_updates_processed_total{{worker="{i}"}} {self.processed[i]}')
+            lines.append(f'tbot_chat_updates_failed_total{{worker="{i}"}} {self.failed[i]}')
+        return "\n".join(lines) + "\n"
+
+
+# Потоки обработки общие для ботов всех арендаторов
+chat_pool = ChatWorkerPool(bot_threads, chat_queue_size)
+
+# Лимиты Telegram на исходящие сообщения одного бота
+telegram_per_second = 30  # всего
+telegram_chat_per_minute = 60  # в личный чат
+telegram_group_per_minute = 20  # в группу
+telegram_chat_burst = 3  # сообщений подряд в чат без ожидания
+telegram_retries = 3  # повторов после 429 (ждем retry_after)
+telegram_senders = int(os.getenv("TELEGRAM_SENDERS", 4))  # потоков отправки
+
+
+class TelegramSender:
+    """Общие потоки отправки для ботов всех арендаторов.
+
+    Исходящие сообщения лежат в очередях чатов (MyBot.outboxes); здесь —
+    куча чатов по времени, когда их следующее сообщение можно отправить.
+    Ожидание лимитов не занимает ни потоки обработки, ни потоки отправки.
+    """
+
+    def __init__(self, size: int):
+        self.due = []  # (время, номер, бот, chat_id)
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.sent = [0] * size
+        self.failed = [0] * size
+        for i in range(size):
+            threading.Thread(
+                target=self._work, args=(i,), name=f"TelegramSender-{i}", daemon=True
+            ).start()
+
+    def schedule(self, bot, chat_id: int, delay: float = 0):
+        with self.cond:
+            heapq.heappush(self.due, (time.monotonic() + delay, next(self.counter), bot, chat_id))
+            self.cond.notify()
+
+    def _work(self, i: int):
+        while True:
+            with self.cond:
+                while not self.due or self.due[0][0] > time.monotonic():
+                    self.cond.wait(self.due[0][0] - time.monotonic() if self.due else None)
+                _, _, bot, chat_id = heapq.heappop(self.due)
+            sent = bot._send_next(chat_id)
+            if sent is True:
+                self.sent[i] += 1
+            elif sent is False:
+                self.failed[i] += 1
+
+    def metrics(self) -> str:
+        """Метрики отправки в текстовом формате Prometheus."""
+        return (
+            f"tbot_telegram_senders {telegram_senders}\n"
+            f"tbot_telegram_chats_waiting {len(self.due)}\n"
+            f"tbot_telegram_sent_total {sum(self.sent)}\n"
+            f"tbot_telegram_failed_total {sum(self.failed)}\n"
+        )
+
+
+telegram_sender = TelegramSender(telegram_senders)
+
+
 class MyBot(TeleBot):
-    def __init__(self, token):
-        super().__init__(token)
+    def __init__(self, token, owner):
+        # собственный пул потоков TeleBot не нужен: задачи уходят в chat_pool
+        super().__init__(token, threaded=False)
         # user_data[chat_id] = {
         #     "state": "...",
         #     "model": "...",
         #     "operation": "...",
         # }
         self.user_data = {}
+        self.tenant = owner
+        # Исходящие сообщения ждут своей очереди в ведрах токенов: общем и чата
+        self.send_bucket = TokenBucket(telegram_per_second * 60, burst=telegram_per_second)
+        self.chat_buckets = {}
+        self.chat_buckets_lock = threading.Lock()
+        # Очереди исходящих по чатам: chat_id -> deque([Future, метод, args, kwargs, лимит, попытка])
+        self.outboxes = {}
+        self.outboxes_lock = threading.Lock()
+
+    def _exec_task(self, task, *args, **kwargs):
+        """Обработчики выполняются в потоке чата: по порядку внутри чата,
+        параллельно для разных чатов, от имени арендатора бота."""
+        chat_id = update_chat_id(args[0]) if args else 0
+        chat_pool.put(chat_id, in_tenant, self.tenant, task, *args, **kwargs)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        with self.chat_buckets_lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                if len(self.chat_buckets) >= 10000:
+                    # ведра, простоявшие минуту, уже полные — их можно забыть
+                    now = time.monotonic()
+                    for key in [k for k, b in self.chat_buckets.items() if now - b.updated > 60]:
+                        del self.chat_buckets[key]
+                group = str(chat_id).startswith("-")
+                per_minute = telegram_group_per_minute if group else telegram_chat_per_minute
+                bucket = self.chat_buckets[chat_id] = TokenBucket(per_minute, burst=telegram_chat_burst)
+            return bucket
+
+    def _enqueue(self, chat_id, throttled: bool, method, *args, **kwargs) -> Future:
+        """Постановка вызова Telegram API в очередь чата; результат — в Future."""
+        future = Future()
+        with self.outboxes_lock:
+            outbox = self.outboxes.get(chat_id)
+            idle = outbox is None
+            if idle:
+                outbox = self.outboxes[chat_id] = deque()
+            outbox.append([future, method, args, kwargs, throttled, 0])
+        if idle:
+            self._schedule(chat_id)
+        return future
+
+    def _schedule(self, chat_id, delay: float = 0):
+        """Планирование следующего вызова из очереди чата с учетом лимита чата."""
+        with self.outboxes_lock:
+            throttled = self.outboxes[chat_id][0][4]
+        if throttled:
+            delay = max(delay, self._chat_bucket(chat_id).reserve())
+        telegram_sender.schedule(self, chat_id, delay)
+
+    def _send_next(self, chat_id) -> bool | None:
+        """Вызов из головы очереди чата (в потоке TelegramSender).
+
+        True — отправлено, False — ошибка, None — вызов отложен.
+        """
+        with self.outboxes_lock:
+            item = self.outboxes[chat_id][0]
+        future, method, args, kwargs, throttled, attempt = item
+        if throttled:
+            wait = self.send_bucket.reserve()
+            if wait > 0:
+                # токен общего ведра занят — отправка в свое время, без повторного резерва
+                item[4] = False
+                telegram_sender.schedule(self, chat_id, wait)
+                return None
+        try:
+            result = method(*args, **kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429 and attempt < telegram_retries:
+                retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+                print(f"telegram_sender {self.tenant.name}: 429 в чате {chat_id}, пауза {retry_after} с")
+                # лимит превышен для всего бота — останавливаем все его отправки
+                self.send_bucket.pause(retry_after)
+                item[4] = True
+                item[5] = attempt + 1
+                self._schedule(chat_id, retry_after)
+                return None
+            if e.error_code == 400 and "message is not modified" in str(getattr(e, "description", "")):
+                # двойное нажатие кнопки: сообщение уже в нужном виде
+                sent = True
+                future.set_result(None)
+            else:
+                sent = self._fail(chat_id, future, e)
+        except Exception as e:
+            sent = self._fail(chat_id, future, e)
+        else:
+            sent = True
+            future.set_result(result)
+
+        with self.outboxes_lock:
+            outbox = self.outboxes[chat_id]
+            outbox.popleft()
+            more = bool(outbox)
+            if not more:
+                del self.outboxes[chat_id]
+        if more:
+            self._schedule(chat_id)
+        return sent
+
+    def _fail(self, chat_id, future, e) -> bool:
+        print(f"telegram_sender {self.tenant.name}: чат {chat_id}: {e!r}")
+        future.set_exception(e)
+        return False
+
+    # Исходящие вызовы уходят в очередь чата и возвращают Future:
+    # обработчик не ждет ни лимитов, ни пауз после 429
+    def send_message(self, chat_id, *args, **kwargs) -> Future:
+        return self._enqueue(chat_id, True, super().send_message, chat_id, *args, **kwargs)
+
+    def edit_message_text(self, text, chat_id=None, *args, **kwargs) -> Future:
+        return self._enqueue(chat_id, True, super().edit_message_text, text, chat_id, *args, **kwargs)
+
+    def edit_message_reply_markup(self, chat_id=None, *args, **kwargs) -> Future:
+        return self._enqueue(
+            chat_id, True, super().edit_message_reply_markup, chat_id, *args, **kwargs
+        )
+
+    def delete_message(self, chat_id, *args, **kwargs) -> Future:
+        # удаление вне лимитов, но в общем порядке с отправками чата
+        return self._enqueue(chat_id, False, super().delete_message, chat_id, *args, **kwargs)
+
+
+# Обработчики регистрируются на боте каждого арендатора: (вид, функция, фильтры)
+HANDLERS = []
+
+
+def message_handler(**kwargs):
+    """Аналог bot.message_handler для ботов всех арендаторов."""
+    def decorator(fn):
+        HANDLERS.append(("message", fn, kwargs))
+        return fn
+    return decorator
+
+
+def callback_query_handler(func, **kwargs):
+    """Аналог bot.callback_query_handler для ботов всех арендаторов."""
+    def decorator(fn):
+        HANDLERS.append(("callback_query", fn, dict(func=func, **kwargs)))
+        return fn
+    return decorator
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return (
+        chat_pool.metrics() + telegram_sender.metrics(),
+        200,
+        {"Content-Type": "text/plain; version=0.0.4"},
+    )
 
 
-bot = MyBot(TOKEN)
+# ==============================
+#  Webhook
+# ==============================
+
+# Если задан WEBHOOK_URL (публичный адрес этого Flask‑приложения), Telegram
+# присылает апдейты POST‑запросами на WEBHOOK_PATH/<имя арендатора>;
+# иначе боты работают через long polling.
+# Состояние диалогов (user_data, latest_messages) и журнал отчетов живут в
+# одном процессе, поэтому у каждого бота должен быть ровно один процесс:
+# апдейты одного токена нельзя делить между процессами за общим ingress.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+webhook_ready = threading.Event()  # журналы и кеши готовы к приему апдейтов
+
+
+@app.route(WEBHOOK_PATH + "/<name>", methods=["POST"])
+def telegram_webhook(name):
+    t = tenants.get(name)
+    if t is None:
+        return "Not Found", 404
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, t.webhook_secret):
+        return "Forbidden", 403
+    if not webhook_ready.is_set():
+        # Telegram повторит доставку позже
+        return "Starting", 503
+    update = telebot.types.Update.de_json(request.get_data().decode("utf-8"))
+    # обработчики лишь ставятся в очередь потока чата, ответ Telegram — сразу
+    t.bot.process_new_updates([update])
+    return "", 200
+
+
+def webhook_url() -> str:
+    return f"{WEBHOOK_URL}{WEBHOOK_PATH}/{tenant.name}"
+
+
+def start_webhook() -> bool:
+    """Регистрация webhook бота арендатора; False — остаемся на long polling."""
+    if not WEBHOOK_URL:
+        return False
+    try:
+        # set_webhook заменяет прежний адрес, снимать его заранее не нужно
+        return bool(tenant.bot.set_webhook(url=webhook_url(), secret_token=tenant.webhook_secret))
+    except Exception as e:
+        print(f"start_webhook {tenant.name}: {e}, переходим на long polling")
+        return False
 
 
 # ==============================
 #  Клавиатуры
 # ==============================
 
-def build_main_reply_keyboard(user_id: int) -> ReplyKeyboardMarkup:
+# Готовые JSON клавиатур арендатор держит в markup_cache;
+# telebot отправляет строку в reply_markup как есть
+def cached_markup(key: tuple, build) -> str:
+    """JSON клавиатуры из markup_cache, при промахе — build().to_json()."""
+    markup = tenant.markup_cache.get(key)
+    if markup is None:
+        markup = tenant.markup_cache[key] = build().to_json()
+    return markup
+
+
+def build_main_reply_keyboard(user_id: int, admin: bool | None = None) -> str:
     """Главное меню в виде reply‑клавиатуры с учетом прав админа."""
+    if admin is None:
+        admin = is_admin(user_id=user_id)
+    return cached_markup(("main", admin), lambda: _main_reply_keyboard(admin))
+
+
+def _main_reply_keyboard(admin: bool) -> ReplyKeyboardMarkup:
     kb = ReplyKeyboardMarkup(resize_keyboard=True)
-    
+
     kb.row(
         KeyboardButton("📝 Заполнить отчет"),
         KeyboardButton("📊 Результат за день"),
@@ -390,21 +1412,25 @@ def build_main_reply_keyboard(user_id: int) -> ReplyKeyboardMarkup:
         KeyboardButton("📅 Результат за месяц"),
         KeyboardButton("🕒 Последние 3 операции"),
     )
-    
+
     # Анекдот + Админ в одном ряду
-    if is_admin(user_id=user_id):
+    if admin:
         kb.row(
             KeyboardButton("🎭 Анекдот"),
             KeyboardButton("🔧 Админ")
         )
     else:
         kb.row(KeyboardButton("🎭 Анекдот"))
-    
+
     return kb
 
 
-def get_def_buttons(show_all: int = 1) -> InlineKeyboardMarkup:
+def get_def_buttons(show_all: int = 1) -> str:
     """Основное inline‑меню (как в оригинале)."""
+    return cached_markup(("def", bool(show_all)), lambda: _def_buttons(show_all))
+
+
+def _def_buttons(show_all: int) -> InlineKeyboardMarkup:
     buttons_list = [[InlineKeyboardButton("Заполнить отчет", callback_data="DEFAULT_DO")]]
     if show_all:
         buttons_list.append(
@@ -413,143 +1439,478 @@ def get_def_buttons(show_all: int = 1) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(buttons_list)
 
 
-def get_buttons_with_models(message) -> InlineKeyboardMarkup:
+def get_buttons_with_models(message) -> str:
     """Inline‑клавиатура с уникальными моделями."""
-    keyboard_buttons = []
+    return cached_markup(("models", tenant.catalog_fingerprint), _models_keyboard)
 
-    models_tuples = [tuple(model) for model in models]
-    unique_models = [list(m) for m in set(models_tuples)]
-    unique_models.sort()
 
-    for m in unique_models:
-        if m and m[0] != "@last_update":
-            keyboard_buttons.append(
-                [InlineKeyboardButton(m[0], callback_data=MODEL_PREFIX + checksum(m[0]))]
-            )
+def _models_keyboard() -> InlineKeyboardMarkup:
+    keyboard_buttons = []
+
+    for model_crc, name in sorted(tenant.catalog_index["models"].items(), key=lambda x: x[1]):
+        keyboard_buttons.append(
+            [InlineKeyboardButton(name, callback_data=MODEL_PREFIX + model_crc)]
+        )
     keyboard_buttons.append(
         [InlineKeyboardButton("-Закрыть отчет-", callback_data=MODEL_PREFIX + "@QuitAndSave")]
     )
     return InlineKeyboardMarkup(keyboard_buttons)
 
 
-def get_buttons_with_questions(path: str, message=None) -> InlineKeyboardMarkup | None:
-    """Inline‑клавиатура с группами операций."""
-    parts = path.split("_")
-    model_crc = parts[0]
-    group_crc = parts[1] if len(parts) > 1 else parts[0]
-    level = int(parts[2]) if len(parts) > 2 else 1
-
-    questions_set = set()
-    for q in questions:
-        if not q:
-            continue
-        if len(q) < 1:
-            continue
-        if checksum(q[0]) != model_crc:
-            continue
-        if len(q) < level + 1:
-            continue
-        group_str = ";".join(q[1 if level > 1 else 0 : 1 + (level - 1 if level > 1 else 0)])
-        if checksum(group_str) != group_crc:
-            continue
-        questions_set.add(";".join(q[1 : 1 + level]))
-
-    if not questions_set:
-        return None
-
+def build_groups_keyboard(model_crc: str, node: dict) -> InlineKeyboardMarkup:
+    """Inline‑клавиатура с подгруппами узла каталога."""
     buttons = []
-    for q in sorted(questions_set):
-        label = q.split(";")[-1]
-        cb = ACTION_PREFIX + model_crc + "_" + checksum(q) + "_" + str(level + 1)
+    for path in sorted(node["children"]):
+        label = path.split(";")[-1]
+        cb = ACTION_PREFIX + model_crc + "_" + checksum(path) + "_" + str(node["level"] + 1)
         buttons.append([InlineKeyboardButton(label, callback_data=cb)])
     buttons.append([InlineKeyboardButton("-Закрыть отчет-", callback_data=ACTION_PREFIX + "@QuitAndSave")])
     return InlineKeyboardMarkup(buttons)
 
 
-def get_buttons_with_questions_detail(path: str, message=None) -> InlineKeyboardMarkup:
+def build_operations_keyboard(model_crc: str, operations: list) -> InlineKeyboardMarkup:
     """Inline‑клавиатура с конкретными операциями (деталями)."""
-    parts = path.split("_")
-    model_crc = parts[0]
-    group_crc = parts[1] if len(parts) > 1 else parts[0]
-
     buttons = []
-    for qd in questions_detail:
-        if not qd or len(qd) <= 2:
-            continue
-        if checksum(qd[0]) != model_crc:
-            continue
-        if checksum(qd[1]) != group_crc:
-            continue
-        cb = QUANTITY_PREFIX + model_crc + "_" + checksum(qd[2])
-        buttons.append([InlineKeyboardButton(qd[2], callback_data=cb)])
+    for operation in operations:
+        cb = QUANTITY_PREFIX + model_crc + "_" + checksum(operation)
+        buttons.append([InlineKeyboardButton(operation, callback_data=cb)])
     buttons.append(
         [InlineKeyboardButton("-Закрыть отчет-", callback_data=QUANTITY_PREFIX + "@QuitAndSave")]
     )
     return InlineKeyboardMarkup(buttons)
 
 
+def get_buttons_with_questions(path: str, message=None) -> str | None:
+    """Inline‑клавиатура с группами операций (готовая, из дерева каталога)."""
+    parts = path.split("_")
+    model_crc = parts[0]
+    group_crc = parts[1] if len(parts) > 1 else parts[0]
+    level = int(parts[2]) if len(parts) > 2 else 1
+
+    return tenant.catalog_index["groups"].get((model_crc, group_crc, level))
+
+
+def get_buttons_with_questions_detail(path: str, message=None) -> str:
+    """Inline‑клавиатура с конкретными операциями (готовая, из дерева каталога)."""
+    parts = path.split("_")
+    model_crc = parts[0]
+    group_crc = parts[1] if len(parts) > 1 else parts[0]
+
+    kb = tenant.catalog_index["details"].get((model_crc, group_crc))
+    if kb is None:
+        kb = cached_markup(("no_operations", model_crc), lambda: build_operations_keyboard(model_crc, []))
+    return kb
+
+
+# ==============================
+#  Журнал отчетов (SQLite)
+# ==============================
+
+# Локальный журнал — источник истины для отчетов; лист "Отчет" догоняет
+# его в фоне (journal_sync): новые строки дописываются пачкой в конец
+# листа, удаления проставляются в "Признак удаления".
+# Журнал арендатора — DATA_DIR/<имя>/journal-<spreadsheet_id>.sqlite3.
+DATA_DIR = os.getenv("DATA_DIR", "data")
+journal_sync_interval = 2  # сек, пауза для накопления пачки
+journal_batch_size = 200  # строк за один append_rows
+journal_retry_period = 30  # сек, пауза после ошибки синхронизации
+
+# Формулы столбцов I:K, как в исходном коде. Номер строки при дописывании
+# в конец листа заранее неизвестен, поэтому формула берет ячейки своей
+# строки через ИНДЕКС(...;СТРОКА()) — в отличие от ДВССЫЛ это не volatile
+# функция, и лист не пересчитывается целиком при каждом изменении
+ANSWER_FORMULAS = [
+    "=ВПР(ИНДЕКС(C:C;СТРОКА())&ИНДЕКС(D:D;СТРОКА());'" + questions_sheet_name + "'!E:F;2;ЛОЖЬ)"
+    "*ИНДЕКС(E:E;СТРОКА())",
+    "=ЕСЛИ(ПСТР(ИНДЕКС(G:G;СТРОКА()); 4; 7) = ПСТР(ТДАТА(); 4; 7);1;0)",
+    "=ЕСЛИОШИБКА(ВПР(ИНДЕКС(B:B;СТРОКА());'" + goals_sheet_name + "'!A:C;3;ЛОЖЬ);ИНДЕКС(A:A;СТРОКА()))",
+]
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_name TEXT,
+    user_id TEXT NOT NULL,
+    model TEXT,
+    operation TEXT,
+    quantity TEXT,
+    date TEXT,
+    add_time TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    synced INTEGER NOT NULL DEFAULT 0,
+    delete_synced INTEGER NOT NULL DEFAULT 1,
+    sheet_row INTEGER
+);
+CREATE INDEX IF NOT EXISTS reports_user_ts ON reports (user_id, ts);
+CREATE INDEX IF NOT EXISTS reports_user_date ON reports (user_id, date);
+CREATE INDEX IF NOT EXISTS reports_user_time ON reports (user_id, add_time);
+CREATE INDEX IF NOT EXISTS reports_pending ON reports (synced, delete_synced);
+"""
+
+# Общий для всех арендаторов сигнал: в каком-то журнале есть что отправить
+journal_sync_event = threading.Event()
+
+
+def _journal_ts(add_time: str) -> str:
+    """Сортируемая метка времени из "дд.мм.гггг чч:мм:сс"."""
+    try:
+        return datetime.strptime(add_time, "%d.%m.%Y %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return ""
+
+
+def _journal_values(row: list, deleted: int, synced: int) -> tuple:
+    row = list(row) + [""] * (7 - len(row))
+    return (
+        str(row[0]),
+        str(row[1]),
+        str(row[2]),
+        str(row[3]),
+        str(row[4]),
+        str(row[5]),
+        str(row[6]),
+        _journal_ts(str(row[6])),
+        deleted,
+        synced,
+    )
+
+
+def open_journal():
+    """Открытие журнала и сверка его с листом "Отчет"."""
+    os.makedirs(tenant.data_dir, exist_ok=True)
+    db = sqlite3.connect(tenant.journal_path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(JOURNAL_SCHEMA)
+
+    with tenant.journal_lock:
+        tenant.journal_db = db
+
+    load_user_operations()
+
+    # полное чтение "Отчет": импорт строк, которых еще нет в журнале
+    reload_data(scope="a", force=True)
+    journal_sync_event.set()
+
+
+def _index_user_operation(row_id: int, values: tuple):
+    """Добавление операции в tenant.user_operations (под tenant.journal_lock)."""
+    user_name, user_id, model, operation, quantity, date, add_time, ts = values[:8]
+    bisect.insort(
+        tenant.user_operations.setdefault(user_id, []),
+        (ts, row_id, (user_id, model, operation, quantity, date, add_time)),
+    )
+
+
+def _unindex_user_operation(user_id: str, add_time: str):
+    """Удаление операций с указанным временем из tenant.user_operations (под tenant.journal_lock)."""
+    ops = tenant.user_operations.get(user_id)
+    if ops:
+        ops[:] = [op for op in ops if op[2][5] != add_time]
+
+
+def load_user_operations():
+    """Построение tenant.user_operations по журналу."""
+    index = {}
+    with tenant.journal_lock:
+        rows = tenant.journal_db.execute(
+            "SELECT id, user_id, model, operation, quantity, date, add_time, ts FROM reports"
+            " WHERE deleted = 0 ORDER BY ts, id"
+        ).fetchall()
+        for row_id, user_id, model, operation, quantity, date, add_time, ts in rows:
+            index.setdefault(user_id, []).append(
+                (ts, row_id, (user_id, model, operation, quantity, date, add_time))
+            )
+        tenant.user_operations = index
+
+
+def _journal_insert(values: tuple) -> int:
+    """Вставка строки в журнал и индекс (под tenant.journal_lock); возвращает id."""
+    cur = tenant.journal_db.execute(
+        "INSERT INTO reports (user_name, user_id, model, operation, quantity, date,"
+        " add_time, ts, deleted, synced) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        values,
+    )
+    if not values[8]:
+        _index_user_operation(cur.lastrowid, values)
+    return cur.lastrowid
+
+
+def journal_add_report(row: list):
+    """Запись строки отчета в журнал; в лист она уйдет фоном."""
+    with tenant.journal_lock, tenant.journal_db:
+        _journal_insert(_journal_values(row, 0, 0))
+    journal_sync_event.set()
+
+
+def journal_mark_deleted(user_id: str, add_time: str) -> int:
+    """Пометка операции пользователя удаленной; возвращает число найденных строк."""
+    with tenant.journal_lock, tenant.journal_db:
+        cur = tenant.journal_db.execute(
+            "UPDATE reports SET deleted = 1, delete_synced = 1 - synced"
+            " WHERE user_id = ? AND add_time = ? AND deleted = 0",
+            (str(user_id), add_time),
+        )
+        _unindex_user_operation(str(user_id), add_time)
+    journal_sync_event.set()
+    return cur.rowcount
+
+
+def journal_merge_sheet_rows(rows: list, first_row: int):
+    """Перенос в журнал строк "Отчет", добавленных или удаленных в обход бота.
+
+    Заодно запоминает номер строки листа каждой операции (sheet_row) и
+    отмечает отправленными строки журнала, которые уже есть в листе.
+    """
+    if tenant.journal_db is None:
+        return
+    with tenant.journal_lock, tenant.journal_db:
+        for sheet_row, row in enumerate(rows, start=first_row):
+            if len(row) <= 6:
+                continue
+            deleted = int(len(row) > 7 and row[7] != "")
+            found = tenant.journal_db.execute(
+                "SELECT id, deleted FROM reports WHERE user_id = ? AND add_time = ?",
+                (str(row[1]), str(row[6])),
+            ).fetchall()
+            if not found:
+                row_id = _journal_insert(_journal_values(row, deleted, 1))
+                tenant.journal_db.execute("UPDATE reports SET sheet_row = ? WHERE id = ?", (sheet_row, row_id))
+                continue
+            # удаление из журнала, которого в листе еще нет, остается в очереди
+            tenant.journal_db.executemany(
+                "UPDATE reports SET sheet_row = ?, synced = 1,"
+                " delete_synced = CASE WHEN deleted = 1 AND ? = 0 THEN 0 ELSE 1 END WHERE id = ?",
+                [(sheet_row, deleted, row_id) for row_id, _ in found],
+            )
+            if deleted and not all(was_deleted for _, was_deleted in found):
+                tenant.journal_db.executemany(
+                    "UPDATE reports SET deleted = 1, delete_synced = 1 WHERE id = ?",
+                    [(row_id,) for row_id, was_deleted in found if not was_deleted],
+                )
+                _unindex_user_operation(str(row[1]), str(row[6]))
+
+
+def journal_last_rows(user_id: str, count: int) -> list:
+    """Последние неудаленные операции пользователя, от новых к старым."""
+    with tenant.journal_lock:
+        ops = tenant.user_operations.get(user_id, [])
+        return [op[2] for op in reversed(ops[-count:])] if count > 0 else []
+
+
+def journal_has_pending(user_id: str) -> bool:
+    """Есть ли у пользователя операции или удаления, еще не отправленные в лист."""
+    with tenant.journal_lock:
+        return (
+            tenant.journal_db.execute(
+                "SELECT 1 FROM reports WHERE user_id = ? AND (synced = 0 OR delete_synced = 0) LIMIT 1",
+                (user_id,),
+            ).fetchone()
+            is not None
+        )
+
+
+def wait_journal_synced(user_id: str, timeout: float) -> bool:
+    """Ожидание, пока journal_sync отправит операции пользователя (не дольше timeout)."""
+    deadline = time.monotonic() + timeout
+    journal_sync_event.set()
+    while journal_has_pending(user_id):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.5)
+    return True
+
+
+def _answer_sheet_row(row: tuple) -> list:
+    """Строка для USER_ENTERED: текст экранируется апострофом, формулы — в конце."""
+    user_name, user_id, model, operation, quantity, date, add_time, deleted = row
+    cells = [
+        "'" + user_name,
+        int(user_id) if user_id.isdigit() else "'" + user_id,
+        "'" + model,
+        "'" + operation,
+        int(quantity) if quantity.lstrip("-").isdigit() else "'" + quantity,
+        "'" + date,
+        "'" + add_time,
+        "удалено" if deleted else "",
+    ]
+    return cells + ANSWER_FORMULAS
+
+
+def mark_deleted_in_sheet(user_id: str, add_time: str):
+    """Проставление "удалено" в листе для операции пользователя."""
+    find_date = tenant.answers_sheet.findall(add_time, in_column=7)
+    for cell in find_date:
+        row = tenant.answers_sheet.get(f"A{cell.row}:H{cell.row}")
+        if row and row[0][1] == user_id:
+            tenant.answers_sheet.update_cell(cell.row, 8, "удалено")
+
+
+def _first_updated_row(response: dict) -> int | None:
+    """Номер первой строки из updatedRange ответа append ("'Отчет'!A120:K121" -> 120)."""
+    updated_range = response.get("updates", {}).get("updatedRange", "")
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
+
+
+def sync_journal() -> int:
+    """Отправка в лист одной пачки новых строк и удалений; возвращает число строк."""
+    if tenant.append_uncertain:
+        # прошлый append_rows упал, но мог примениться: полное чтение "Отчет"
+        # отметит дошедшие строки отправленными, и они не задвоятся
+        refresh_scopes(["a"], datetime.today(), force=True)
+        tenant.append_uncertain = False
+
+    with tenant.journal_lock:
+        new_rows = tenant.journal_db.execute(
+            "SELECT id, user_name, user_id, model, operation, quantity, date, add_time, deleted"
+            " FROM reports WHERE synced = 0 ORDER BY id LIMIT ?",
+            (journal_batch_size,),
+        ).fetchall()
+        deleted_rows = tenant.journal_db.execute(
+            "SELECT id, user_id, add_time, sheet_row FROM reports"
+            " WHERE synced = 1 AND delete_synced = 0 ORDER BY id LIMIT ?",
+            (journal_batch_size,),
+        ).fetchall()
+
+    if new_rows:
+        try:
+            response = tenant.answers_sheet.append_rows(
+                [_answer_sheet_row(row[1:]) for row in new_rows],
+                value_input_option="USER_ENTERED",
+                insert_data_option="INSERT_ROWS",
+                table_range="A1",
+            )
+        except Exception as e:
+            # 4xx — запись отклонена; таймаут или 5xx — могла примениться
+            if not (isinstance(e, APIError) and e.response.status_code < 500):
+                tenant.append_uncertain = True
+            raise
+        first_row = _first_updated_row(response or {})
+        # удаление, сделанное во время append, в лист еще не попало: такая
+        # строка остается в очереди удалений (journal_mark_deleted для
+        # неотправленной строки ставит delete_synced = 1)
+        with tenant.journal_lock, tenant.journal_db:
+            tenant.journal_db.executemany(
+                "UPDATE reports SET synced = 1, sheet_row = ?,"
+                " delete_synced = CASE WHEN deleted = ? THEN 1 ELSE 0 END WHERE id = ?",
+                [
+                    (first_row + i if first_row else None, row[8], row[0])
+                    for i, row in enumerate(new_rows)
+                ],
+            )
+
+    # удаления с известной строкой листа: строка сверяется по user_id и
+    # времени (ее могли сдвинуть вручную), затем — одним batch_update
+    located = [row for row in deleted_rows if row[3]]
+    moved = [row for row in deleted_rows if not row[3]]
+    if located:
+        current = tenant.answers_sheet.batch_get(
+            [f"A{sheet_row}:G{sheet_row}" for _, _, _, sheet_row in located]
+        )
+        current = list(current)
+        confirmed = []
+        for i, row in enumerate(located):
+            # строка без ответа считается сдвинутой и ищется заново
+            values = current[i] if i < len(current) else []
+            cells = values[0] if values else []
+            if len(cells) > 6 and str(cells[1]) == row[1] and str(cells[6]) == row[2]:
+                confirmed.append(row)
+            else:
+                moved.append(row)
+        if confirmed:
+            tenant.answers_sheet.batch_update(
+                [{"range": f"H{sheet_row}", "values": [["удалено"]]} for _, _, _, sheet_row in confirmed]
+            )
+    for _, user_id, add_time, _ in moved:
+        mark_deleted_in_sheet(user_id, add_time)
+    if moved:
+        # номер строки устарел — его заново проставит сверка "Отчет"
+        with tenant.journal_lock, tenant.journal_db:
+            tenant.journal_db.executemany(
+                "UPDATE reports SET sheet_row = NULL WHERE id = ?",
+                [(row[0],) for row in moved if row[3]],
+            )
+    if deleted_rows:
+        with tenant.journal_lock, tenant.journal_db:
+            tenant.journal_db.executemany(
+                "UPDATE reports SET delete_synced = 1 WHERE id = ?",
+                [(row[0],) for row in deleted_rows],
+            )
+
+    # кеш "Результативность" этих пользователей устарел
+    synced_at = datetime.today()
+    for user_id in {row[2] for row in new_rows} | {row[1] for row in deleted_rows}:
+        tenant.results_synced_at[user_id] = synced_at
+
+    return len(new_rows) + len(deleted_rows)
+
+
+def journal_sync():
+    """Фоновая синхронизация журналов арендаторов с их листами "Отчет"."""
+    while True:
+        journal_sync_event.wait()
+        time.sleep(journal_sync_interval)
+        journal_sync_event.clear()
+        failed = False
+        for t in tenants.values():
+            try:
+                with use_tenant(t):
+                    while sheets_call(sync_journal):
+                        pass
+            except Exception as e:
+                print(f"journal_sync {t.name}: {e}")
+                failed = True
+        if failed:
+            journal_sync_event.set()
+            time.sleep(journal_retry_period)
+
+
 # ==============================
 #  Вспомогательные функции
 # ==============================
 
 def is_admin(message=None, user_id=None) -> bool:
-    """Проверка, что текущий пользователь — администратор."""
+    """Проверка, что текущий пользователь — администратор.
+
+    Результат для message запоминается на самом объекте, чтобы один апдейт
+    не проверял права повторно.
+    """
     # Определяем user_id из параметров
     if user_id is None:
         if message is None:
             return False
+        memo = getattr(message, "_is_admin", None)
+        if memo is not None:
+            return memo
         user_id = message.from_user.id
 
-    reload_data(scope="s")
-    # Проверяем в настройках
-    for s in settings:
-        if (s and len(s) >= 2 and 
-            s[0] == "Администратор" and 
-            s[1] == str(user_id)):
-            return True
-    return False
+    # Настройки держит теплыми cache_refresher; грузим только при холодном старте
+    if tenant.settings_last_update == NEVER_UPDATED:
+        reload_data(scope="s")
+    result = str(user_id) in tenant.admin_ids
+
+    if message is not None:
+        message._is_admin = result
+    return result
 
 
 def get_last_rows(user_id: int, count: int = 5):
-    """Последние N операций пользователя из листа ответов."""
+    """Последние N операций пользователя из локального журнала."""
     if not user_id:
         return []
 
-    reload_data(scope="a")
-
-    df = pd.DataFrame(
-        answers,
-        columns=[
-            "Сотрудник имя",
-            "Сотрудник ID",
-            "Модель",
-            "Операция",
-            "Количество",
-            "Дата",
-            "Время",
-            "Признак удаления",
-        ],
-    )
-    df = df.loc[lambda x: x["Сотрудник ID"] == str(user_id)]
-    df = df.loc[lambda x: x["Признак удаления"].isnull()]
-
-    if df.empty:
-        return []
-
-    df["TimeStamp"] = pd.to_datetime(df["Время"], format="%d.%m.%Y %H:%M:%S")
-    df = df.sort_values(by="TimeStamp", ascending=False).head(count)
-
     ops = []
-    for _, row in df.iterrows():
+    for row in journal_last_rows(str(user_id), count):
         ops.append(
             [
                 {
-                    "chat_id": row["Сотрудник ID"],
-                    "model": row["Модель"],
-                    "operation": row["Операция"],
-                    "count": row["Количество"],
-                    "date": row["Дата"],
-                    "add_date": row["Время"],
+                    "chat_id": row[0],
+                    "model": row[1],
+                    "operation": row[2],
+                    "count": row[3],
+                    "date": row[4],
+                    "add_date": row[5],
                 }
             ]
         )
@@ -562,12 +1923,13 @@ def get_results(message, date: str = "") -> str:
     if not date:
         date = today
 
-    reload_data(scope="r")
-    if results and len(results[0]) > 1:
-        for r in results:
-            if r[1] == str(message.chat.id) and r[2] == str(date) and r[2]:
-                return r[3]
-    return "0"
+    user_id = str(message.chat.id)
+    # сумму считает лист; операции, еще не ушедшие в него, сначала отправляем
+    if journal_has_pending(user_id):
+        wait_journal_synced(user_id, sheets_timeout)
+
+    reload_data(message, "r", force=results_outdated(user_id))
+    return tenant.results_by_day.get((user_id, str(date)), "0")
 
 
 # ==============================
@@ -575,21 +1937,20 @@ def get_results(message, date: str = "") -> str:
 # ==============================
 
 def save_operation(message):
-    """Сохранение введенного количества и выбранной операции в Google Sheets."""
+    """Сохранение введенного количества и выбранной операции (в локальный журнал)."""
     chat_id = message.chat.id
-    user_state = bot.user_data.get(chat_id, {})
+    user_state = tenant.bot.user_data.get(chat_id, {})
 
     if user_state.get("state") != "WAIT_QUANTITY":
-        bot.send_message(chat_id, "Не вижу активной операции для сохранения. Начни отчет заново командой /report.")
+        tenant.bot.send_message(chat_id, "Не вижу активной операции для сохранения. Начни отчет заново командой /report.")
         return
 
     try:
         quantity = int(message.text)
     except ValueError:
-        bot.send_message(chat_id, "Количество должно быть числом. Попробуй еще раз.")
+        tenant.bot.send_message(chat_id, "Количество должно быть числом. Попробуй еще раз.")
         return
 
-    save_info = bot.send_message(chat_id, "Минуту, сохраняю данные...")
     model = user_state.get("model", "")
     operation = user_state.get("operation", "")
 
@@ -602,26 +1963,13 @@ def save_operation(message):
         datetime.now(pytz.utc).strftime("%d.%m.%Y"),
         datetime.now(pytz.utc).strftime("%d.%m.%Y %H:%M:%S"),
     ]
-    answers_sheet.insert_row(row, index=2)
-
-    # Формулы, как в исходном коде
-    formula1 = "=ВПР(C2&D2;'{}'!E:F;2;ЛОЖЬ)*E2".format(questions_sheet_name)
-    formula2 = "=ЕСЛИ(ПСТР(G2; 4; 7) = ПСТР(ТДАТА(); 4; 7);1;0)"
-    formula3 = "=ЕСЛИОШИБКА(ВПР(B2;'{}'!A:C;3;ЛОЖЬ);A2)".format(goals_sheet_name)
-
-    cells_to_update = [
-        gspread.Cell(2, 9, formula1),
-        gspread.Cell(2, 10, formula2),
-        gspread.Cell(2, 11, formula3),
-    ]
-    answers_sheet.update_cells(cells_to_update, value_input_option="USER_ENTERED")
+    journal_add_report(row)
 
     # Сбрасываем состояние и предлагаем продолжить
-    bot.user_data[chat_id] = {}
-    user_id = message.from_user.id    
+    tenant.bot.user_data[chat_id] = {}
+    user_id = message.from_user.id
     keyboard = build_main_reply_keyboard(user_id)
-    bot.delete_message(save_info.chat.id, save_info.message_id)    
-    bot.send_message(chat_id, "Отлично, операция сохранена.", reply_markup=keyboard)
+    tenant.bot.send_message(chat_id, "Отлично, операция сохранена.", reply_markup=keyboard)
     report_command(message, "Продолжим заполнение отчета?")
 
 
@@ -629,86 +1977,86 @@ def save_operation(message):
 #  Уведомления
 # ==============================
 
-def notify(exc: bool = False):
-    """Фоновая отправка уведомлений пользователям по расписанию."""
-    while True:
-        try:
-            reload_data(scope="s+g")
-            filtered_settings = [x for x in settings if x and x[0] == "Интервал уведомлений"]
-            if not filtered_settings:
-                # если нет настроек — спим и повторяем
-                time.sleep(600)
-                if exc:
-                    return
-                continue
+def notify_tenant():
+    """Проход уведомлений пользователей арендатора по расписанию из настроек."""
+    reload_data(scope="s+g")
+    filtered_settings = [x for x in tenant.settings if x and x[0] == "Интервал уведомлений"]
+    if not filtered_settings:
+        # если нет настроек — ждем следующего прохода
+        return
 
-            time_notification = filtered_settings[0][1].split("_")
-            if len(time_notification) < 3:
-                time.sleep(600)
-                if exc:
-                    return
-                continue
+    time_notification = filtered_settings[0][1].split("_")
+    if len(time_notification) < 3:
+        return
 
-            now_time = datetime.now(pytz.utc).time()
-            now_date = datetime.now(pytz.utc).strftime("%d.%m.%Y")
+    now_time = datetime.now(pytz.utc).time()
+    now_date = datetime.now(pytz.utc).strftime("%d.%m.%Y")
 
-            week_days = time_notification[0].split(";")
-            current_day_of_week = datetime.now().weekday() + 1
+    week_days = time_notification[0].split(";")
+    current_day_of_week = datetime.now().weekday() + 1
 
-            if not any(day.startswith(str(current_day_of_week)) for day in week_days):
-                time.sleep(600)
-                if exc:
-                    return
-                continue
+    if not any(day.startswith(str(current_day_of_week)) for day in week_days):
+        return
 
-            t_start = datetime.strptime(time_notification[1], "%H:%M").time()
-            t_end = datetime.strptime(time_notification[2], "%H:%M").time()
-            if not (t_start <= now_time <= t_end):
-                time.sleep(600)
-                if exc:
-                    return
-                continue
+    t_start = datetime.strptime(time_notification[1], "%H:%M").time()
+    t_end = datetime.strptime(time_notification[2], "%H:%M").time()
+    if not (t_start <= now_time <= t_end):
+        return
 
-            filtered_chat_ids = [x for x in goals if x and x[0] != "*"]
+    filtered_chat_ids = [x for x in tenant.goals if x and x[0] != "*"]
 
-            global logs_sheet
-            logs_sheet = gc.worksheet(logs_sheet_name)
-            if logs_sheet.row_count > 100:
-                last_logs = logs_sheet.get(f"A{logs_sheet.row_count - 100}:H")
-            else:
-                last_logs = logs_sheet.get("A1:H")
-
-            for chat_id in filtered_chat_ids:
-                last_logs_by_chat = [
-                    row
-                    for row in last_logs
-                    if len(row) > 3
-                    and row[1] != "datetime"
-                    and datetime.strptime(row[1], "%d.%m.%Y %H:%M:%S").strftime("%d.%m.%Y")
-                    == now_date
-                    and t_start
-                    <= datetime.strptime(row[1], "%d.%m.%Y %H:%M:%S").time()
-                    <= t_end
-                    and row[2] == chat_id[0]
+    tenant.logs_sheet = tenant.gc.worksheet(logs_sheet_name)
+    if tenant.logs_sheet.row_count > 100:
+        last_logs = tenant.logs_sheet.get(f"A{tenant.logs_sheet.row_count - 100}:H")
+    else:
+        last_logs = tenant.logs_sheet.get("A1:H")
+
+    for chat_id in filtered_chat_ids:
+        last_logs_by_chat = [
+            row
+            for row in last_logs
+            if len(row) > 3
+            and row[1] != "datetime"
+            and datetime.strptime(row[1], "%d.%m.%Y %H:%M:%S").strftime("%d.%m.%Y")
+            == now_date
+            and t_start
+            <= datetime.strptime(row[1], "%d.%m.%Y %H:%M:%S").time()
+            <= t_end
+            and row[2] == chat_id[0]
+        ]
+        if not last_logs_by_chat:
+            tenant.bot.send_message(chat_id[0], "😊")
+            msg = tenant.bot.send_message(
+                chat_id[0], filtered_settings[0][2], parse_mode="HTML"
+            ).result()
+            tenant.logs_sheet.append_row(
+                [
+                    "notify.daily",
+                    datetime.now(pytz.utc).strftime("%d.%m.%Y %H:%M:%S"),
+                    chat_id[0],
+                    msg.text,
                 ]
-                if not last_logs_by_chat:
-                    msg = bot.send_message(chat_id[0], "😊")
-                    msg = bot.send_message(
-                        chat_id[0], filtered_settings[0][2], parse_mode="HTML"
-                    )
-                    logs_sheet.append_row(
-                        [
-                            "notify.daily",
-                            datetime.now(pytz.utc).strftime("%d.%m.%Y %H:%M:%S"),
-                            chat_id[0],
-                            msg.text,
-                        ]
-                    )
-        except Exception:
+            )
+
+
+def notify():
+    """Фоновая отправка уведомлений пользователям всех арендаторов."""
+    while True:
+        failed = []
+        for t in tenants.values():
+            try:
+                in_tenant(t, notify_tenant)
+            except Exception as e:
+                print(f"notify {t.name}: {e}")
+                failed.append(t)
+        if failed:
+            # после ошибки — один повтор через минуту
             time.sleep(60)
-            notify(True)
-        if exc:
-            return
+            for t in failed:
+                try:
+                    in_tenant(t, notify_tenant)
+                except Exception as e:
+                    print(f"notify {t.name}: {e}")
         time.sleep(600)
 
 
@@ -716,12 +2064,12 @@ def notify(exc: bool = False):
 #  Команды пользователя
 # ==============================
 
-@bot.message_handler(commands=["start"])
+@message_handler(commands=["start"])
 def start_command(message):
     reload_data(scope="s", force=True, silent=True)
     user_id = message.chat.id
     main_kb = build_main_reply_keyboard(user_id)
-    bot.send_message(
+    tenant.bot.send_message(
         message.chat.id,
         f"Привет, {message.from_user.first_name}!\n\n{welcome_message}",
         reply_markup=main_kb,
@@ -731,43 +2079,35 @@ def start_command(message):
 
 def def_command(message, text="Вот мои команды:"):
     kb = get_def_buttons()
-    last_question = bot.send_message(message.chat.id, text, reply_markup=kb)
-    message_user_set.add(
-        {"message_id": last_question.message_id, "chat_id": last_question.chat.id}
-    )
+    tenant.latest_messages.add_sent(tenant.bot.send_message(message.chat.id, text, reply_markup=kb))
 
 
-@bot.message_handler(commands=["report"])
+@message_handler(commands=["report"])
 def report_command(message, adt: str = ""):
     reload_data(message, "m+q+qd+s")
     kb = get_buttons_with_models(message)
     prefix = (adt + "\n") if adt else ""
-    last_question = bot.send_message(
-        message.chat.id, prefix + "Выберите модель", reply_markup=kb
-    )
-    message_user_set.add(
-        {"message_id": last_question.message_id, "chat_id": last_question.chat.id}
+    tenant.latest_messages.add_sent(
+        tenant.bot.send_message(message.chat.id, prefix + "Выберите модель", reply_markup=kb)
     )
 
 
-@bot.message_handler(commands=["calculate"])
+@message_handler(commands=["calculate"])
 def calculate_command(message):
     finish(message)
 
 
-@bot.message_handler(commands=["calculate_month"])
+@message_handler(commands=["calculate_month"])
 def calculate_month_command(message):
     users_report_month(message)
 
 
-@bot.message_handler(commands=["last_3_rows"])
+@message_handler(commands=["last_3_rows"])
 def last_rows_command(message):
-    info = bot.send_message(message.chat.id, "Загружаю данные...")
     operations = get_last_rows(message.chat.id, count=3)
-    bot.delete_message(message.chat.id, info.message_id)
 
     if not operations:
-        bot.send_message(message.chat.id, "Ничего нет.")
+        tenant.bot.send_message(message.chat.id, "Ничего нет.")
         return
 
     for op in operations:
@@ -781,7 +2121,7 @@ def last_rows_command(message):
             ]
         ]
         kb = InlineKeyboardMarkup(buttons)
-        bot.send_message(
+        tenant.bot.send_message(
             message.chat.id,
             f"*Модель*: {data['model']}\n"
             f"*Операция*: {data['operation']}\n"
@@ -796,7 +2136,7 @@ def last_rows_command(message):
 #  Reply‑меню: обработка текстовых кнопок
 # ==============================
 
-@bot.message_handler(
+@message_handler(
     func=lambda m: m.text in [
         "📝 Заполнить отчет",
         "📊 Результат за день",
@@ -808,7 +2148,7 @@ def last_rows_command(message):
 )
 def main_menu_handler(message):
     user_id = message.from_user.id
-    keyboard = build_main_reply_keyboard(user_id)
+    keyboard = build_main_reply_keyboard(user_id, is_admin(message))
     
     if message.text == "📝 Заполнить отчет":
         report_command(message)
@@ -819,12 +2159,12 @@ def main_menu_handler(message):
     elif message.text == "🕒 Последние 3 операции":
         last_rows_command(message)
     elif message.text == "🎭 Анекдот":
-        bot.send_message(message.chat.id, get_anekdot(), reply_markup=keyboard)
+        tenant.bot.send_message(message.chat.id, get_anekdot(), reply_markup=keyboard)
     elif message.text == "🔧 Админ":
         if is_admin(message):
             admin_command(message)
         else:
-            bot.send_message(
+            tenant.bot.send_message(
                 message.chat.id, 
                 "❌ Доступ запрещен!", 
                 reply_markup=keyboard
@@ -835,29 +2175,28 @@ def main_menu_handler(message):
 #  Админ‑команды
 # ==============================
 
-@bot.message_handler(commands=["admin"])
+@message_handler(commands=["admin"])
 def admin_command(message):
     if not is_admin(message):
-        bot.send_message(message.chat.id, "Ты не админ!")
+        tenant.bot.send_message(message.chat.id, "Ты не админ!")
         return
 
     buttons = [
         [InlineKeyboardButton("Отчет по всем сотрудникам", callback_data="admin_UserReport")]
     ]
     kb = InlineKeyboardMarkup(buttons)
-    last_question = bot.send_message(message.chat.id, "Меню администратора", reply_markup=kb)
-    message_user_set.add(
-        {"message_id": last_question.message_id, "chat_id": last_question.chat.id}
+    tenant.latest_messages.add_sent(
+        tenant.bot.send_message(message.chat.id, "Меню администратора", reply_markup=kb)
     )
 
-@bot.message_handler(commands=["admin"])
+@message_handler(commands=["admin"])
 def admin_command_handler(message):
     """Обработчик команды /admin."""
     if is_admin(message):
         admin_command(message)
     else:
-        keyboard = build_main_reply_keyboard(message.from_user.id)
-        bot.send_message(
+        keyboard = build_main_reply_keyboard(message.from_user.id, False)
+        tenant.bot.send_message(
             message.chat.id, 
             "❌ Доступ запрещен!", 
             reply_markup=keyboard
@@ -868,7 +2207,7 @@ def admin_command_handler(message):
 #  Callback‑хендлеры
 # ==============================
 
-@bot.callback_query_handler(lambda q: q.data.startswith("delete"))
+@callback_query_handler(lambda q: q.data.startswith("delete"))
 def delete_callback(callback_query):
     data = callback_query.data[len("delete_") :].split("_")
     chat_id, add_date = data[0], data[1]
@@ -883,33 +2222,32 @@ def delete_callback(callback_query):
         [InlineKeyboardButton("↑ Отмена ↑", callback_data="canceldelete")],
     ]
     kb = InlineKeyboardMarkup(buttons)
-    bot.edit_message_reply_markup(
+    tenant.bot.edit_message_reply_markup(
         callback_query.message.chat.id, callback_query.message.message_id, reply_markup=kb
     )
 
 
-@bot.callback_query_handler(lambda q: q.data.startswith("canceldelete"))
+@callback_query_handler(lambda q: q.data.startswith("canceldelete"))
 def cancel_delete_callback(callback_query):
-    bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+    tenant.bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
 
 
-@bot.callback_query_handler(lambda q: q.data.startswith("confdelete_"))
+@callback_query_handler(lambda q: q.data.startswith("confdelete_"))
 def confirm_delete_callback(callback_query):
     data = callback_query.data[len("confdelete_") :].split("_")
     chat_id, find_time = data[0], data[1]
 
-    find_date = answers_sheet.findall(find_time, in_column=7)
-    for cell in find_date:
-        row = answers_sheet.get(f"A{cell.row}:H{cell.row}")
-        if row and row[0][1] == chat_id:
-            answers_sheet.update_cell(cell.row, 8, "удалено")
+    # операции, которых нет в журнале, удаляем прямо в листе
+    if not journal_mark_deleted(chat_id, find_time):
+        sheets_call(mark_deleted_in_sheet, chat_id, find_time)
+        tenant.results_synced_at[chat_id] = datetime.today()
 
-    bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+    tenant.bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
 
 
-@bot.callback_query_handler(lambda q: q.data.startswith("DEFAULT"))
+@callback_query_handler(lambda q: q.data.startswith("DEFAULT"))
 def default_callback(callback_query):
-    bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+    tenant.bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
     data = callback_query.data[len("DEFAULT") :].split("_")
     if len(data) < 2:
         return
@@ -920,102 +2258,31 @@ def default_callback(callback_query):
         finish(callback_query.message, done=0)
 
 
-@bot.callback_query_handler(lambda q: q.data.startswith("admin_UserReport"))
+@callback_query_handler(lambda q: q.data.startswith("admin_UserReport"))
 def admin_user_report_callback(callback_query):
-    reload_data(scope="s", force=True)
     if not is_admin(user_id=callback_query.message.chat.id):
-        bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
-        bot.send_message(callback_query.message.chat.id, "Ты не админ!")
+        tenant.bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+        tenant.bot.send_message(callback_query.message.chat.id, "Ты не админ!")
         return
 
-    info = bot.send_message(callback_query.message.chat.id, "Загружаю данные...")
-    bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
-
-    reload_data(scope="r", force=True)
-    results_detail = results
-
-    lines: list[str] = []
-    current_user_id = None
-    current_user_name = None
-    total_line = None  # сохраняем итоговую строку заранее
-
-    header = "Дата         Сумма       Часы"
-
-    for row in results_detail:
-        fio, user_id, date_raw, sum_raw, mot_raw,time_raw = row
-
-        # финальное Итого по предприятию - сохраняем строку
-        if fio == "Итого":             
-            total_line = f"{'':<12} {sum_raw:<11} {time_raw}"
-            continue
-
-        # ------- ИТОГ ПО ПОЛЬЗОВАТЕЛЮ -------
-        if isinstance(fio, str) and user_id.startswith("Всего ("):
-            lines.append("—" * len(header))
-            lines.append(f"{fio:<12} {sum_raw:<11} {time_raw}")
-            lines.append("")  # пустая строка-разделитель
-            current_user_id = None
-            current_user_name = None
-            continue
-        # ------- КОНЕЦ БЛОКА ИТОГА -------
-
-        # обычные строки с операциями
-        if user_id != current_user_id:
-            current_user_id = user_id
-            current_user_name = fio
-            lines.append(f"{current_user_name}")
-            lines.append(header)
-            lines.append("—" * len(header))
+    chat_id = callback_query.message.chat.id
+    reload_data(callback_query.message, "r", force=results_outdated())
 
-        date_str = str(date_raw or "")
-        sum_str = str(sum_raw or "")
-        time_str = str(time_raw or "")
-
-        lines.append(f"{date_str:<12} {sum_str:<11} {time_str}")
-
-    # добавляем общий итог по предприятию
-    if total_line:
-        lines.append("")
-        lines.append("Итого по предприятию")
-        lines.append("—" * len(header))
-        lines.append(total_line)
-
-    now = datetime.now()
-    month_name = MONTHS_RU[now.month]
-    
-    bot.delete_message(callback_query.message.chat.id, info.message_id)
-    
-    # Разбиваем на блоки
-    def send_in_chunks(lines_list, chat_id):
-        chunk_size = 3800  # запас от 4096
-        current_chunk = []
-        current_length = 0
-        
-        for line in lines_list:
-            test_chunk = current_chunk + [line]
-            test_length = sum(len(l) for l in test_chunk) + len(test_chunk) - 1  # + \n между строками
-            
-            if current_length + len(line) + 1 > chunk_size or test_length > chunk_size:
-                if current_chunk:
-                    text = f"Текущая результативность за {month_name} {now.year}:\n<pre><code>\n" + "\n".join(current_chunk) + "\n</code></pre>"
-                    bot.send_message(chat_id, text, parse_mode="HTML")
-                current_chunk = [line]
-                current_length = len(line)
-            else:
-                current_chunk.append(line)
-                current_length = test_length
-        
-        # отправляем последний чанк
-        if current_chunk:
-            text = f"Текущая результативность за {month_name} {now.year}:\n<pre><code>\n" + "\n".join(current_chunk) + "\n</code></pre>"
-            bot.send_message(chat_id, text, parse_mode="HTML")
-    
-    send_in_chunks(lines, callback_query.message.chat.id)
+    # меню администратора превращается в первую часть отчета
+    report = tenant.company_report
+    if not report:
+        tenant.bot.delete_message(chat_id, callback_query.message.message_id)
+        return
+    tenant.bot.edit_message_text(
+        report[0], chat_id, callback_query.message.message_id, parse_mode="HTML"
+    )
+    for text in report[1:]:
+        tenant.bot.send_message(chat_id, text, parse_mode="HTML")
 
 
-@bot.callback_query_handler(lambda q: q.data.startswith("admin_Hide"))
+@callback_query_handler(lambda q: q.data.startswith("admin_Hide"))
 def admin_hide_callback(callback_query):
-    info = bot.send_message(callback_query.message.chat.id, "Работаю...")
+    tenant.bot.send_chat_action(callback_query.message.chat.id, "typing")
     obj = callback_query.data[len("admin_Hide") :].split("_")
 
     oper = "m"
@@ -1027,7 +2294,7 @@ def admin_hide_callback(callback_query):
         obj[1] = obj[1][1:]
 
     reload_data(scope="qd", force=True)
-    data = questions_detail_sheet.get_all_values()
+    data = sheets_call(tenant.questions_detail_sheet.get_all_values)
 
     done = ["", ""]
     for row in data:
@@ -1060,95 +2327,90 @@ def admin_hide_callback(callback_query):
                 new_keyboard.append(key_row)
 
         kb.keyboard = new_keyboard
-        bot.edit_message_reply_markup(
+        tenant.bot.edit_message_reply_markup(
             callback_query.message.chat.id,
             callback_query.message.message_id,
             reply_markup=kb,
         )
 
-    bot.delete_message(callback_query.message.chat.id, info.message_id)
-    bot.send_message(
+    tenant.bot.send_message(
         callback_query.message.chat.id,
         f"Скрыто: {done[0]}; {done[1]}",
     )
 
 
-@bot.callback_query_handler(lambda q: q.data.startswith(MODEL_PREFIX))
+@callback_query_handler(lambda q: q.data.startswith(MODEL_PREFIX))
 def model_callback(callback_query):
     reload_data(scope="q+qd")
-    bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.message_id
 
-    key = frozenset(
-        {"message_id": callback_query.message.message_id, "chat_id": callback_query.message.chat.id}.items()
-    )
-    if key not in message_user_set:
+    if not tenant.latest_messages.is_latest(chat_id, message_id):
+        # повторное нажатие на сообщение, отредактированное на месте, — не удаляем его
+        if not tenant.latest_messages.is_closed(chat_id, message_id):
+            tenant.bot.delete_message(chat_id, message_id)
         return
 
     model_id = callback_query.data[len(MODEL_PREFIX) :]
     if model_id == "@QuitAndSave":
+        tenant.bot.delete_message(chat_id, message_id)
         finish(callback_query.message)
         return
 
     model_name = model_by_id(model_id)
-    if model_name:
-        bot.send_message(callback_query.message.chat.id, model_name)
 
-    kb = get_buttons_with_questions(model_id, callback_query.message if is_admin(callback_query.message) else None)
+    admin_message = callback_query.message if is_admin(callback_query.message) else None
+    kb = get_buttons_with_questions(model_id, admin_message)
     if not kb:
-        kb = get_buttons_with_questions_detail(model_id, callback_query.message if is_admin(callback_query.message) else None)
+        kb = get_buttons_with_questions_detail(model_id, admin_message)
 
-    last_question = bot.send_message(
-        callback_query.message.chat.id, "Выберите группу", reply_markup=kb
-    )
-    message_user_set.add(
-        {"message_id": last_question.message_id, "chat_id": last_question.chat.id}
-    )
+    # следующий шаг — в том же сообщении, вместо удаления и двух новых
+    text = f"{model_name}\nВыберите группу" if model_name else "Выберите группу"
+    tenant.bot.edit_message_text(text, chat_id, message_id, reply_markup=kb)
+    tenant.latest_messages.add(chat_id, message_id)
 
 
-@bot.callback_query_handler(lambda q: q.data.startswith(ACTION_PREFIX))
+@callback_query_handler(lambda q: q.data.startswith(ACTION_PREFIX))
 def group_callback(callback_query):
     reload_data(scope="q+qd")
-    bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.message_id
 
-    key = frozenset(
-        {"message_id": callback_query.message.message_id, "chat_id": callback_query.message.chat.id}.items()
-    )
-    if key not in message_user_set:
+    if not tenant.latest_messages.is_latest(chat_id, message_id):
+        # повторное нажатие на сообщение, отредактированное на месте, — не удаляем его
+        if not tenant.latest_messages.is_closed(chat_id, message_id):
+            tenant.bot.delete_message(chat_id, message_id)
         return
 
     data = callback_query.data[len(ACTION_PREFIX) :].split(";")[0]
     if data == "@QuitAndSave":
+        tenant.bot.delete_message(chat_id, message_id)
         finish(callback_query.message)
         return
 
-    kb = get_buttons_with_questions(
-        data, callback_query.message if is_admin(callback_query.message) else None
-    )
+    admin_message = callback_query.message if is_admin(callback_query.message) else None
+    kb = get_buttons_with_questions(data, admin_message)
     if not kb:
-        kb = get_buttons_with_questions_detail(
-            data, callback_query.message if is_admin(callback_query.message) else None
-        )
+        kb = get_buttons_with_questions_detail(data, admin_message)
 
-    last_question = bot.send_message(
-        callback_query.message.chat.id, "Выберите операцию", reply_markup=kb
-    )
-    message_user_set.add(
-        {"message_id": last_question.message_id, "chat_id": last_question.chat.id}
-    )
+    tenant.bot.edit_message_text("Выберите операцию", chat_id, message_id, reply_markup=kb)
+    tenant.latest_messages.add(chat_id, message_id)
 
 
-@bot.callback_query_handler(lambda q: q.data.startswith(QUANTITY_PREFIX))
+@callback_query_handler(lambda q: q.data.startswith(QUANTITY_PREFIX))
 def quantity_callback(callback_query):
-    bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.message_id
 
-    key = frozenset(
-        {"message_id": callback_query.message.message_id, "chat_id": callback_query.message.chat.id}.items()
-    )
-    if key not in message_user_set:
+    if not tenant.latest_messages.is_latest(chat_id, message_id):
+        # повторное нажатие на сообщение, отредактированное на месте, — не удаляем его
+        if not tenant.latest_messages.is_closed(chat_id, message_id):
+            tenant.bot.delete_message(chat_id, message_id)
         return
 
     data = callback_query.data[len(QUANTITY_PREFIX) :].split("_")
     if data[0] == "@QuitAndSave":
+        tenant.bot.delete_message(chat_id, message_id)
         finish(callback_query.message)
         return
 
@@ -1156,16 +2418,14 @@ def quantity_callback(callback_query):
     model_name = model_by_id(model_id)
     question_text = question_detail_by_id(question_id)
 
-    if question_text:
-        bot.send_message(callback_query.message.chat.id, question_text)
-
-    last_question = bot.send_message(callback_query.message.chat.id, "Укажите количество:")
-    message_user_set.add(
-        {"message_id": "Укажите количество:", "chat_id": last_question.chat.id}
-    )
+    # клавиатура убирается, операция и вопрос — в том же сообщении
+    text = f"{question_text}\nУкажите количество:" if question_text else "Укажите количество:"
+    tenant.bot.edit_message_text(text, chat_id, message_id)
+    # клавиатура убрана — повторное нажатие на нее уже не обрабатывается
+    tenant.latest_messages.close(chat_id, message_id)
 
     # сохраняем состояние
-    bot.user_data[callback_query.message.chat.id] = {
+    tenant.bot.user_data[callback_query.message.chat.id] = {
         "state": "WAIT_QUANTITY",
         "model": model_name or "",
         "operation": question_text or "",
@@ -1178,17 +2438,14 @@ def quantity_callback(callback_query):
 
 def finish(message, done: int = 1):
     """Подсчет результата и вывод."""
-    info = bot.send_message(message.chat.id, "Считаю результат...")
-    reload_data(scope="r", force=True)
     res = get_results(message)
-    bot.delete_message(info.chat.id, info.message_id)
     if done:
-        bot.send_message(
+        tenant.bot.send_message(
             message.chat.id,
             f"На сегодня результат: {res}",
         )
     else:
-        bot.send_message(
+        tenant.bot.send_message(
             message.chat.id,
             f"Результат за день: {res}",
         )
@@ -1196,56 +2453,176 @@ def finish(message, done: int = 1):
 
 def users_report_month(message):
     """Отчет по дням за месяц по пользователю."""
-    info = bot.send_message(message.chat.id, "Загружаю данные...")
-    reload_data(scope="r")
-    results_detail = results
-
-    table = ""
-    messages = []
-    if len(results_detail) > 1:
-        table += "Вот ваши результаты по дням:\n"
-        for row in results_detail:
-            if len(row) < 6:
-                continue
-            if row[1] != str(message.chat.id) and row[1] != f"Всего ({message.chat.id})":
-                continue
+    reload_data(message, "r", force=results_outdated(message.chat.id))
 
-            table += f"<b>{row[2].ljust(25 - len(row[2]))}</b>"
-            table += f"<b>{row[3].rjust(15 - len(row[3]))}</b>"
-            table += f"<b>{row[5].rjust(15 - len(row[5]))}</b> ч."
-            if len(table) > 3000:
-                messages.append(table)
-                table = ""
-            table += "\n"
-        if table:
-            messages.append(table)
+    if len(tenant.results) > 1:
+        messages = tenant.month_reports.get(str(message.chat.id)) or [MONTH_REPORT_TITLE]
     else:
-        messages.append("Пока пусто")
+        messages = ["Пока пусто"]
 
-    bot.delete_message(message.chat.id, info.message_id)
-    for i, msg in enumerate(messages):
-        bot.send_message(
-            message.chat.id,
-            ("\n ->" if i > 0 else "") + msg,
-            parse_mode="HTML",
+    for msg in messages:
+        tenant.bot.send_message(message.chat.id, msg, parse_mode="HTML")
+
+
+MONTH_REPORT_TITLE = "Вот ваши результаты по дням:"
+MONTH_REPORT_CONTINUED = "->\n"
+COMPANY_REPORT_HEADER = "Дата         Сумма       Часы"
+
+
+def materialize_reports(values: list):
+    """Сборка текстов отчетов один раз на обновление "Результативность"."""
+    tenant.month_reports = {
+        user_id: month_report_messages(rows) for user_id, rows in tenant.results_by_user.items()
+    }
+    now = datetime.now()
+    tenant.company_report = chunk_lines(
+        company_report_lines(values),
+        f"Текущая результативность за {MONTHS_RU[now.month]} {now.year}:\n<pre><code>\n",
+        "\n</code></pre>",
+    )
+
+
+def month_report_messages(rows: list) -> list:
+    """Сообщения "Результат за месяц" по строкам пользователя."""
+    lines = [MONTH_REPORT_TITLE]
+    for row in rows:
+        if len(row) < 6:
+            continue
+        lines.append(
+            f"<b>{row[2].ljust(25 - len(row[2]))}</b>"
+            f"<b>{row[3].rjust(15 - len(row[3]))}</b>"
+            f"<b>{row[5].rjust(15 - len(row[5]))}</b> ч."
         )
+    chunks = chunk_lines(lines, limit=TELEGRAM_MESSAGE_LIMIT - len(MONTH_REPORT_CONTINUED))
+    return chunks[:1] + [MONTH_REPORT_CONTINUED + chunk for chunk in chunks[1:]]
+
+
+def company_report_lines(values: list) -> list:
+    """Строки таблицы отчета по всем сотрудникам."""
+    lines: list[str] = []
+    current_user_id = None
+    current_user_name = None
+    total_line = None  # сохраняем итоговую строку заранее
+
+    header = COMPANY_REPORT_HEADER
+
+    for row in values:
+        fio, user_id, date_raw, sum_raw, mot_raw, time_raw = (list(row) + [""] * 6)[:6]
+
+        # финальное Итого по предприятию - сохраняем строку
+        if fio == "Итого":
+            total_line = f"{'':<12} {sum_raw:<11} {time_raw}"
+            continue
+
+        # ------- ИТОГ ПО ПОЛЬЗОВАТЕЛЮ -------
+        if isinstance(fio, str) and user_id.startswith("Всего ("):
+            lines.append("—" * len(header))
+            lines.append(f"{fio:<12} {sum_raw:<11} {time_raw}")
+            lines.append("")  # пустая строка-разделитель
+            current_user_id = None
+            current_user_name = None
+            continue
+        # ------- КОНЕЦ БЛОКА ИТОГА -------
+
+        # обычные строки с операциями
+        if user_id != current_user_id:
+            current_user_id = user_id
+            current_user_name = fio
+            lines.append(f"{current_user_name}")
+            lines.append(header)
+            lines.append("—" * len(header))
+
+        date_str = str(date_raw or "")
+        sum_str = str(sum_raw or "")
+        time_str = str(time_raw or "")
+
+        lines.append(f"{date_str:<12} {sum_str:<11} {time_str}")
+
+    # добавляем общий итог по предприятию
+    if total_line:
+        lines.append("")
+        lines.append("Итого по предприятию")
+        lines.append("—" * len(header))
+        lines.append(total_line)
+    return lines
+
+
+TELEGRAM_MESSAGE_LIMIT = 4096  # в единицах UTF-16, как считает Telegram
+
+
+def utf16_len(text: str) -> int:
+    """Длина текста в единицах UTF-16 (эмодзи и т.п. занимают две)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def chunk_lines(
+    lines: list, prefix: str = "", suffix: str = "", limit: int = TELEGRAM_MESSAGE_LIMIT
+) -> list:
+    """Разбиение строк на сообщения prefix + строки через "\n" + suffix длиной до limit.
+
+    Обертка (например, "<pre><code>" и "</code></pre>") повторяется в каждом
+    сообщении, поэтому разметка не рвется; строки целиком переходят в
+    следующее сообщение, длиннее бюджета — режутся. Один проход по строкам.
+    """
+    budget = limit - utf16_len(prefix) - utf16_len(suffix)
+    chunks = []
+    current = []
+    length = 0
+
+    for line in lines:
+        size = utf16_len(line)
+        if size > budget:
+            pieces = _split_utf16(line, budget)
+            line = pieces.pop()
+            size = utf16_len(line)
+            for piece in pieces:
+                if current:
+                    chunks.append(prefix + "\n".join(current) + suffix)
+                current = [piece]
+                length = budget
+        if current and length + 1 + size > budget:
+            chunks.append(prefix + "\n".join(current) + suffix)
+            current = []
+            length = 0
+        length += size + (1 if current else 0)
+        current.append(line)
+
+    if current:
+        chunks.append(prefix + "\n".join(current) + suffix)
+    return chunks
+
+
+def _split_utf16(text: str, budget: int) -> list:
+    """Куски текста не длиннее budget единиц UTF-16 (суррогатные пары не рвутся)."""
+    pieces = []
+    start = 0
+    length = 0
+    for i, char in enumerate(text):
+        size = 2 if ord(char) > 0xFFFF else 1
+        if length + size > budget:
+            pieces.append(text[start:i])
+            start = i
+            length = 0
+        length += size
+    pieces.append(text[start:])
+    return pieces
 
 
 # ==============================
 #  Обработка текстов (количество)
 # ==============================
 
-@bot.message_handler(func=lambda m: True, content_types=["text"])
+@message_handler(func=lambda m: True, content_types=["text"])
 def text_handler(message):
     """Обработка текста, когда ждем количество."""
-    user_state = bot.user_data.get(message.chat.id, {})
+    user_state = tenant.bot.user_data.get(message.chat.id, {})
     if user_state.get("state") == "WAIT_QUANTITY":
         save_operation(message)
         return
     else:
         user_id = message.chat.id
         main_kb = build_main_reply_keyboard(user_id)
-        bot.send_message(
+        tenant.bot.send_message(
             message.chat.id,
             f"Привет, {message.from_user.first_name}!",
             reply_markup=main_kb,
@@ -1257,16 +2634,100 @@ def text_handler(message):
 # ==============================
 
 
+def size_http_pool(tenant_count: int):
+    """Размер пула соединений на хост по числу арендаторов и потоков.
+
+    Long polling каждого бота держит соединение с Telegram до 30 с, поэтому
+    остальным потокам (обработчикам, Sheets, уведомлениям) нужны свои.
+    """
+    size = max(
+        http_pool_size,
+        tenant_count * (1 + sheets_workers) + bot_threads + telegram_senders + 2,
+    )
+    if size != http_pool_size:
+        print(f"HTTP pool: {size} соединений на хост")
+    http_adapter.init_poolmanager(http_pool_hosts, size, block=True)
+
+
+def load_tenants() -> dict:
+    """Подключение арендаторов по ключам: имя -> Tenant."""
+    tenants = {}
+    keys = load_tenant_keys()
+    size_http_pool(len(keys))
+    for name, key in keys.items():
+        # у каждого арендатора свой каталог журнала, как бы ни был задан ключ
+        data_dir = os.path.join(DATA_DIR, name)
+        try:
+            tenants[name] = Tenant(name, key, data_dir)
+        except Exception as e:
+            # арендатор с недоступной таблицей или ключом пропускается,
+            # остальные боты работают
+            print(f"load_tenants {name}: {e!r}, пропускаем")
+    if not tenants:
+        raise RuntimeError("Не удалось подключить ни одного арендатора")
+    return tenants
+
+
+tenants = load_tenants()
+
+
+def poll_updates():
+    """Long polling бота арендатора."""
+    if WEBHOOK_URL:
+        # webhook зарегистрировать не удалось; если он все же установлен
+        # (этим адресом или другим процессом), не снимаем его — polling
+        # с установленным webhook все равно невозможен
+        info = tenant.bot.get_webhook_info()
+        if info.url:
+            print(f"poll_updates {tenant.name}: установлен webhook {info.url}, polling не запускаем")
+            return
+    if is_running_in_docker():
+        tenant.bot.infinity_polling(timeout=30, long_polling_timeout=30)
+    else:
+        tenant.bot.infinity_polling()
+
+
 def main():
+    # Запуск синхронизации журналов отчетов с листами
+    for name, t in list(tenants.items()):
+        try:
+            in_tenant(t, open_journal)
+        except Exception as e:
+            print(f"open_journal {name}: {e!r}")
+            if t.journal_db is None:
+                # без журнала бот не может принимать отчеты
+                del tenants[name]
+            else:
+                # упало только чтение "Отчет" — сверку повторит cache_refresher
+                journal_sync_event.set()
+    sync_thread = threading.Thread(target=journal_sync, daemon=True)
+    sync_thread.start()
+
+    # Запуск фонового обновления кешей
+    refresher_thread = threading.Thread(target=cache_refresher, daemon=True)
+    refresher_thread.start()
+
     # Запуск фонового уведомителя
     notify_thread = threading.Thread(target=notify, daemon=True)
     notify_thread.start()
 
-    # Запуск бота
-    if is_running_in_docker():
-        bot.infinity_polling(timeout=30, long_polling_timeout=30)
-    else:
-        bot.infinity_polling()
+    # Запуск ботов: webhook через Flask, при неудаче — long polling
+    polling_threads = []
+    for t in tenants.values():
+        with use_tenant(t):
+            if start_webhook():
+                print(f"Webhook: {webhook_url()}")
+                continue
+        polling_threads.append(
+            threading.Thread(
+                target=in_tenant, args=(t, poll_updates), name=f"Polling-{t.name}", daemon=True
+            )
+        )
+    webhook_ready.set()
+    for thread in polling_threads:
+        thread.start()
+    for thread in polling_threads:
+        thread.join()
 
 
 if __name__ == "__main__":